@@ -0,0 +1,118 @@
+"""Cost of collecting a streamed chat completion on the client side.
+
+Compares the `str +=` loop the examples used to build content and tool call
+arguments with examples/stream_aggregator.py, on synthetic streams of 10k
+chunks (long answer, long reasoning, one tool call with long arguments and
+parallel tool calls):
+
+    python benchmarks/aggregation.py --chunks 10000 --chunk-size 4
+"""
+import argparse
+import sys
+import timeit
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "examples"))
+
+from stream_aggregator import StreamAggregator  # noqa: E402
+
+
+def chunk(content=None, reasoning=None, tool_calls=None, finish_reason=None):
+    delta = SimpleNamespace(content=content, reasoning_content=reasoning, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=finish_reason)])
+
+
+def tool_call_chunk(index, arguments, id=None, name=None):
+    return SimpleNamespace(index=index, id=id, type="function" if id else None,
+                           function=SimpleNamespace(name=name, arguments=arguments))
+
+
+def make_streams(chunks, size):
+    text = "Zamek Królewski, Łazienki, Stare Miasto. "
+    part = (text * (size // len(text) + 1))[:size]
+    streams = {
+        "content": [chunk(content=part) for _ in range(chunks)],
+        "reasoning+content": [chunk(reasoning=part) for _ in range(chunks // 2)]
+                             + [chunk(content=part) for _ in range(chunks - chunks // 2)],
+        "one tool call": [chunk(tool_calls=[tool_call_chunk(0, '{"content": "', id="call_0", name="save_report")])]
+                         + [chunk(tool_calls=[tool_call_chunk(0, part)]) for _ in range(chunks - 2)]
+                         + [chunk(tool_calls=[tool_call_chunk(0, '"}')])],
+        "4 parallel tool calls": [],
+    }
+    for index in range(4):
+        streams["4 parallel tool calls"] += (
+            [chunk(tool_calls=[tool_call_chunk(index, '{"text": "', id=f"call_{index}", name="save_report")])]
+            + [chunk(tool_calls=[tool_call_chunk(index, part)]) for _ in range(chunks // 4 - 2)]
+            + [chunk(tool_calls=[tool_call_chunk(index, '"}')])])
+    for stream in streams.values():
+        stream.append(chunk(finish_reason="stop"))
+    return streams
+
+
+def concatenate(stream):
+    """The loop of process_streamed_response in the examples before StreamAggregator."""
+    full_response_content = ""
+    full_reasoning_content = ""
+    tool_call_deltas_aggregator = {}
+    for chunk in stream:
+        delta = chunk.choices[0].delta
+        if delta.reasoning_content:
+            full_reasoning_content += delta.reasoning_content
+        elif delta.content:
+            full_response_content += delta.content
+        if delta.tool_calls:
+            for tool_call_chunk in delta.tool_calls:
+                index = tool_call_chunk.index
+                if index not in tool_call_deltas_aggregator:
+                    tool_call_deltas_aggregator[index] = {
+                        "id": None, "type": "function", "function": {"name": "", "arguments": ""}}
+                if tool_call_chunk.id:
+                    tool_call_deltas_aggregator[index]["id"] = tool_call_chunk.id
+                if tool_call_chunk.type:
+                    tool_call_deltas_aggregator[index]["type"] = tool_call_chunk.type
+                if tool_call_chunk.function:
+                    if tool_call_chunk.function.name:
+                        tool_call_deltas_aggregator[index]["function"]["name"] += tool_call_chunk.function.name
+                    if tool_call_chunk.function.arguments:
+                        tool_call_deltas_aggregator[index]["function"]["arguments"] += \
+                            tool_call_chunk.function.arguments
+        if chunk.choices[0].finish_reason:
+            break
+    return full_response_content, full_reasoning_content, [
+        tool_call_deltas_aggregator[index] for index in sorted(tool_call_deltas_aggregator)]
+
+
+def aggregate(stream):
+    aggregator = StreamAggregator()
+    for chunk in stream:
+        aggregator.add(chunk)
+        if aggregator.finish_reason:
+            break
+    return aggregator.message(reasoning_as_content=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=10000, help="chunks per stream")
+    parser.add_argument("--chunk-size", type=int, default=4, help="characters per chunk")
+    parser.add_argument("--number", type=int, default=20, help="runs per stream and method")
+    args = parser.parse_args()
+
+    header = f"{'stream':<24}{'chars':>9}{'str +=':>12}{'aggregator':>12}   speedup"
+    print(header)
+    print("-" * len(header))
+    for name, stream in make_streams(args.chunks, args.chunk_size).items():
+        content, reasoning, tool_calls = concatenate(stream)
+        message = aggregate(stream)
+        if ((message["content"] or "") != content or message.get("reasoning", "") != reasoning
+                or message.get("tool_calls", []) != tool_calls):
+            raise SystemExit(f"{name}: the aggregator's message differs from the str += loop")
+        chars = len(content) + len(reasoning) + sum(len(tool_call["function"]["arguments"]) for tool_call in tool_calls)
+        timings = [min(timeit.repeat(lambda: method(stream), number=args.number, repeat=3)) / args.number * 1e3
+                   for method in (concatenate, aggregate)]
+        print(f"{name:<24}{chars:>9}{timings[0]:>10.2f}ms{timings[1]:>10.2f}ms   {timings[0] / timings[1]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Time it takes to construct a BielikToolParser, which vLLM does for every request.
+
+The tokenizer is harness.StubTokenizer, which like Hugging Face tokenizers
+builds a new dict of the whole vocabulary (32k entries for Bielik) whenever
+it is asked for it. Pass several parser files to compare them:
+
+    git show HEAD~1:tools/bielik_vllm_tool_parser.py > /tmp/old_parser.py
+    python benchmarks/construction.py --parser /tmp/old_parser.py --parser tools/bielik_vllm_tool_parser.py
+
+Reported: the first construction for a new tokenizer, the mean of every
+construction after it, and building a stream state for an existing parser.
+"""
+import argparse
+import time
+import timeit
+from pathlib import Path
+
+import harness
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--parser", dest="parsers", action="append", type=Path,
+                        help="tool parser file to benchmark, can be given more than once "
+                             "(default: tools/bielik_vllm_tool_parser.py)")
+    parser.add_argument("--number", type=int, default=2000, help="constructions per parser")
+    parser.add_argument("--vocab-size", type=int, default=harness.BIELIK_VOCAB_SIZE)
+    args = parser.parse_args()
+
+    header = f"{'parser':<50}{'first':>12}{'per request':>14}{'stream state':>15}"
+    print(header)
+    print("-" * len(header))
+    for parser_path in args.parsers or [harness.PARSER_PATH]:
+        module = harness.load_tool_parser(parser_path)
+        tokenizer = harness.StubTokenizer(args.vocab_size)
+
+        started = time.perf_counter()
+        tool_parser = module.BielikToolParser(tokenizer)
+        first = time.perf_counter() - started
+        per_request = min(timeit.repeat(lambda: module.BielikToolParser(tokenizer),
+                                        number=args.number, repeat=3)) / args.number
+        if hasattr(tool_parser, "new_stream_state"):
+            state = min(timeit.repeat(tool_parser.new_stream_state, number=args.number, repeat=3)) / args.number
+            state_column = f"{state * 1e6:>13.2f}us"
+        else:
+            state_column = f"{'-':>15}"
+        print(f"{str(parser_path)[-50:]:<50}{first * 1e6:>10.1f}us{per_request * 1e6:>12.2f}us{state_column}")
+
+
+if __name__ == "__main__":
+    main()
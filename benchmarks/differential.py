@@ -0,0 +1,259 @@
+"""Differential test of the streaming and non-streaming tool call extraction.
+
+Every stored completion is split into deltas at random token boundaries and
+replayed through `extract_tool_calls_streaming`; the concatenated tool call
+names and arguments must equal what `extract_tool_calls` returns for the full
+text, and the parsed arguments left in `prev_tool_call_arr` must match them.
+When the last delta ends a tool call's arguments, the arguments the client
+gets after vLLM's end-of-stream check (harness.finish_delta) must decode to
+the same values.
+For each mismatch the chunking is shrunk to the fewest deltas that still
+fail and written out as a reproducer. Traces are checked in a process pool:
+
+    python benchmarks/differential.py --chunkings 500
+    python benchmarks/differential.py --traces-file completions.jsonl --workers 32 --out mismatches/
+    python benchmarks/differential.py --reproduce mismatches/single_tool_call-17.json
+
+Completions the non-streaming path rejects (malformed or truncated JSON) are
+expected to diverge - the streaming path has already sent part of them - so
+their traces store the result every chunking must stream instead:
+`"expected_stream": {"content": ..., "tool_calls": [...], "arguments": [...]}`,
+with the tool calls as sent and the arguments left in `prev_tool_call_arr`.
+Rejected completions without one are only counted. `--metrics` checks
+parsers instrumented by BIELIK_TOOL_PARSER_METRICS. Exits with status 1 if
+any mismatch is found.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Optional
+
+import harness
+
+_module = None
+_tokenizer = None
+
+
+def _init_worker(parser_path: Path, metrics: bool = False) -> None:
+    global _module, _tokenizer
+    # malformed completions make the parser log exceptions, which are expected here
+    logging.getLogger().addHandler(logging.NullHandler())
+    _module = harness.load_tool_parser(parser_path)
+    if metrics:
+        _module.BielikToolParser.metrics = _module.BielikParserMetrics()
+    _tokenizer = harness.StubTokenizer()
+
+
+def random_chunks(rng: random.Random, token_count: int, max_chunk: int) -> list[int]:
+    """Delta sizes biased towards single tokens, with the occasional long delta."""
+    sizes, remaining = [], token_count
+    while remaining:
+        size = min(remaining, rng.randint(1, rng.choice((1, 2, 4, max_chunk))))
+        sizes.append(size)
+        remaining -= size
+    return sizes
+
+
+def chunkings(name: str, token_count: int, seed: int, start: int, count: int, max_chunk: int):
+    """The chunkings `start` .. `start + count` of a trace; the same for any batching."""
+    for index in range(start, start + count):
+        if index == 0:
+            yield index, [1] * token_count
+        elif index == 1:
+            yield index, [token_count]
+        else:
+            yield index, random_chunks(random.Random(f"{seed}:{name}:{index}"), token_count, max_chunk)
+
+
+def expected_result(text: str) -> tuple[Optional[str], Optional[list[dict]]]:
+    """(content, tool calls) of the non-streaming path, tool calls None if it rejected the text."""
+    parser = _module.BielikToolParser(_tokenizer)
+    # with the keywords vLLM's OpenAI server passes
+    extracted = parser.extract_tool_calls(text, request=harness.new_request())
+    if not extracted.tools_called:
+        return extracted.content, None if harness.TOOL_CALL_START in text else []
+    return extracted.content, [{"name": tool_call.function.name, "arguments": tool_call.function.arguments}
+                               for tool_call in extracted.tool_calls]
+
+
+def stored_result(trace: dict) -> tuple[Optional[str], Optional[list[dict]], Optional[list]]:
+    """(content, tool calls, parsed arguments) stored for a completion the non-streaming path rejects."""
+    expected = trace.get("expected_stream")
+    if expected is None:
+        return None, None, None
+    return expected["content"], expected["tool_calls"], expected["arguments"]
+
+
+def compare(token_ids: list[int], sizes: list[int], content: Optional[str], tool_calls: list[dict],
+            arguments: Optional[list] = None) -> Optional[dict]:
+    """Stream the tokens in deltas of `sizes` and return a description of the first difference.
+
+    `arguments` are the parsed arguments expected in `prev_tool_call_arr`,
+    by default those of `tool_calls`.
+    """
+    parser = _module.BielikToolParser(_tokenizer)
+    deltas = harness.replay_stream(parser, _tokenizer, token_ids, harness.new_request(),
+                                   chunks=lambda token_count: sizes)
+    streamed_content, streamed_calls = harness.collect_stream(deltas)
+    if not streamed_content.startswith(content or ""):
+        return {"reason": "content", "expected": content, "streamed": streamed_content}
+    if not tool_calls:
+        if streamed_calls or streamed_content != content:
+            return {"reason": "tool calls in plain text", "expected": content,
+                    "streamed": {"content": streamed_content, "tool_calls": streamed_calls}}
+        return None
+    if streamed_calls != tool_calls:
+        return {"reason": "tool calls", "expected": tool_calls, "streamed": streamed_calls}
+    if arguments is None:
+        arguments = [json.loads(tool_call["arguments"]) for tool_call in tool_calls]
+    parsed = [entry.get("arguments") for entry in parser.prev_tool_call_arr]
+    if parsed != arguments:
+        return {"reason": "prev_tool_call_arr", "expected": arguments, "streamed": parsed}
+    return compare_finish(parser, deltas, parsed)
+
+
+def compare_finish(parser, deltas: list, expected_arguments: list) -> Optional[dict]:
+    """Check the arguments the client gets when vLLM's end-of-stream check rewrites the last delta."""
+    last = deltas[-1] if deltas else None
+    # vLLM only sends the rest of the last tool call's arguments in place of
+    # that delta; its content, names and other tool calls are lost, which no
+    # parser can change
+    if last is None or last.content or len(last.tool_calls or ()) != 1 \
+            or last.tool_calls[0].index != len(expected_arguments) - 1 or last.tool_calls[0].function.name:
+        return None
+    _, client_calls = harness.collect_stream([*deltas[:-1], harness.finish_delta(parser, last)])
+    try:
+        received = [json.loads(tool_call["arguments"]) for tool_call in client_calls]
+    except ValueError:
+        received = None
+    if received != expected_arguments:
+        return {"reason": "end-of-stream check", "expected": expected_arguments,
+                "streamed": [tool_call["arguments"] for tool_call in client_calls]}
+    return None
+
+
+def shrink(token_ids: list[int], sizes: list[int], content: Optional[str], tool_calls: list[dict],
+           arguments: Optional[list] = None) -> list[int]:
+    """Merge neighbouring deltas for as long as the mismatch persists."""
+    changed = True
+    while changed:
+        changed = False
+        index = 0
+        while index < len(sizes) - 1:
+            merged = sizes[:index] + [sizes[index] + sizes[index + 1]] + sizes[index + 2:]
+            if compare(token_ids, merged, content, tool_calls, arguments) is not None:
+                sizes, changed = merged, True
+            else:
+                index += 1
+    return sizes
+
+
+def check_trace(trace: dict, seed: int, start: int, count: int, max_chunk: int) -> dict:
+    """Check one batch of chunkings of a trace and stop at its first mismatch."""
+    token_ids = _tokenizer.encode_tokens(trace["tokens"])
+    content, tool_calls = expected_result(_tokenizer.decode(token_ids))
+    arguments = None
+    if tool_calls is None:
+        content, tool_calls, arguments = stored_result(trace)
+        if tool_calls is None:
+            return {"name": trace["name"], "status": "rejected", "checked": 0}
+    checked = 0
+    for index, sizes in chunkings(trace["name"], len(token_ids), seed, start, count, max_chunk):
+        checked += 1
+        difference = compare(token_ids, sizes, content, tool_calls, arguments)
+        if difference is not None:
+            sizes = shrink(token_ids, sizes, content, tool_calls, arguments)
+            difference = compare(token_ids, sizes, content, tool_calls, arguments)
+            stored = {"expected_stream": trace["expected_stream"]} if arguments is not None else {}
+            return {"name": trace["name"], "status": "mismatch", "checked": checked, "reproducer": {
+                "name": trace["name"], "chunking": index, "tokens": trace["tokens"], "chunks": sizes,
+                **stored, **difference}}
+    return {"name": trace["name"], "status": "ok", "checked": checked}
+
+
+def reproduce(path: Path, parser_path: Path, metrics: bool = False) -> int:
+    _init_worker(parser_path, metrics)
+    reproducer = json.loads(path.read_text(encoding="utf-8"))
+    token_ids = _tokenizer.encode_tokens(reproducer["tokens"])
+    content, tool_calls = expected_result(_tokenizer.decode(token_ids))
+    arguments = None
+    if tool_calls is None:
+        content, tool_calls, arguments = stored_result(reproducer)
+        if tool_calls is None:
+            print("the non-streaming path rejects this completion and no expected stream is stored")
+            return 0
+    difference = compare(token_ids, reproducer["chunks"], content, tool_calls, arguments)
+    print(json.dumps(difference, ensure_ascii=False, indent=2) if difference else "no mismatch")
+    return 1 if difference else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--parser", type=Path, default=harness.PARSER_PATH, help="tool parser file to check")
+    parser.add_argument("--traces-file", type=Path, action="append",
+                        help="JSONL file of stored completions, can be given more than once "
+                             "(default: benchmarks/traces/bielik_streams.jsonl)")
+    parser.add_argument("--traces", nargs="*", help="names of the traces to check (default: all)")
+    parser.add_argument("--chunkings", type=int, default=200, help="random chunkings of every trace")
+    parser.add_argument("--max-chunk", type=int, default=16, help="largest number of tokens in one delta")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--batch", type=int, default=100, help="chunkings per worker task")
+    parser.add_argument("--out", type=Path, help="directory for the reproducers of mismatches")
+    parser.add_argument("--reproduce", type=Path, help="replay a reproducer written by an earlier run")
+    parser.add_argument("--metrics", action="store_true", help="check parsers with their stage metrics on")
+    args = parser.parse_args()
+
+    if args.reproduce:
+        sys.exit(reproduce(args.reproduce, args.parser, args.metrics))
+
+    traces = [trace for path in args.traces_file or [harness.TRACES_PATH]
+              for trace in harness.load_traces(path, args.traces)]
+    if not traces:
+        raise SystemExit("no traces to check")
+    tasks = [(trace, args.seed, start, min(args.batch, args.chunkings - start), args.max_chunk)
+             for trace in traces for start in range(0, args.chunkings, args.batch)]
+
+    started = time.perf_counter()
+    statuses: dict[str, str] = {}
+    checked, mismatches = 0, {}
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.parser, args.metrics)) as executor:
+        for future in as_completed([executor.submit(check_trace, *task) for task in tasks]):
+            result = future.result()
+            checked += result["checked"]
+            if result["status"] == "mismatch":
+                previous = mismatches.get(result["name"])
+                if previous is None or result["reproducer"]["chunking"] < previous["chunking"]:
+                    mismatches[result["name"]] = result["reproducer"]
+            statuses.setdefault(result["name"], result["status"])
+            if result["status"] == "mismatch":
+                statuses[result["name"]] = "mismatch"
+    elapsed = time.perf_counter() - started
+
+    rejected = sorted(name for name, status in statuses.items() if status == "rejected")
+    print(f"{len(traces)} traces, {checked} chunkings checked in {elapsed:.1f}s "
+          f"({checked / elapsed:.0f}/s, {args.workers} workers)")
+    if rejected:
+        print(f"rejected by extract_tool_calls without an expected stream, not compared: {', '.join(rejected)}")
+    for name, reproducer in sorted(mismatches.items()):
+        print(f"MISMATCH {name}: {reproducer['reason']} with {len(reproducer['chunks'])} deltas "
+              f"{reproducer['chunks']}")
+        print(f"  expected: {json.dumps(reproducer['expected'], ensure_ascii=False)[:300]}")
+        print(f"  streamed: {json.dumps(reproducer['streamed'], ensure_ascii=False)[:300]}")
+        if args.out:
+            args.out.mkdir(parents=True, exist_ok=True)
+            path = args.out / f"{name}-{reproducer['chunking']}.json"
+            path.write_text(json.dumps(reproducer, ensure_ascii=False, indent=2), encoding="utf-8")
+            print(f"  reproducer: {path}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+"""Offline support code for exercising the Bielik tool parser without vLLM.
+
+`install_vllm_stubs()` registers minimal stand-ins for the parts of vLLM the
+parser imports (the OpenAI protocol classes, ToolParser, init_logger, ...), so
+the parser can be loaded on CPU-only machines without vLLM or a GPU.
+`StubTokenizer` has the `<tool_call>`/`</tool_call>` vocab entries plus
+filler up to the size of the Bielik vocabulary, and `replay_stream()` feeds a
+recorded token stream through `extract_tool_calls_streaming` the way vLLM's
+OpenAI server does, `finish_delta()` included.
+"""
+import importlib.util
+import itertools
+import json
+import logging
+import re
+import sys
+import types
+import uuid
+from functools import cached_property
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+PARSER_PATH = REPO_DIR / "tools" / "bielik_vllm_tool_parser.py"
+TRACES_PATH = Path(__file__).resolve().parent / "traces" / "bielik_streams.jsonl"
+
+TOOL_CALL_START = "<tool_call>"
+TOOL_CALL_END = "</tool_call>"
+BIELIK_VOCAB_SIZE = 32128
+
+_request_counter = itertools.count()
+
+# rough stand-in for the Bielik tokenizer, used for traces stored as plain text
+_TEXT_TOKENS = re.compile(r"</?tool_call>|\s?\w{1,6}|\s?(?!</?tool_call>)[^\w\s]|\s+")
+
+# the tools of the weather examples, sent with every replayed request
+TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_current_weather",
+            "description": "Get the current weather",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "location": {"type": "string", "description": "The city and state, e.g. San Francisco, CA"},
+                },
+                "required": ["location"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_n_day_weather_forecast",
+            "description": "Get an N-day weather forecast",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "location": {"type": "string", "description": "The city and state, e.g. San Francisco, CA"},
+                    "num_days": {"type": "integer", "description": "The number of days to forecast"},
+                },
+                "required": ["location", "num_days"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "save_report",
+            "description": "Save a report to a file",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "title": {"type": "string"},
+                    "content": {"type": "string"},
+                    "sections": {"type": "array", "items": {"type": "object"}},
+                },
+                "required": ["title", "content"],
+            },
+        },
+    },
+]
+
+
+class _Model:
+    """Tiny stand-in for vLLM's pydantic OpenAI protocol models."""
+
+    _fields: dict = {}
+
+    def __init__(self, **kwargs):
+        for field, default in self._fields.items():
+            value = kwargs.pop(field, default)
+            setattr(self, field, list(value) if isinstance(value, list) else value)
+        for field, value in kwargs.items():  # OpenAI models allow extra fields
+            setattr(self, field, value)
+
+    def model_dump(self, exclude_none: bool = False) -> dict:
+        def dump(value):
+            if isinstance(value, _Model):
+                return value.model_dump(exclude_none=exclude_none)
+            if isinstance(value, list):
+                return [dump(item) for item in value]
+            return value
+        return {field: dump(value) for field, value in vars(self).items()
+                if not (exclude_none and value is None)}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.model_dump(exclude_none=True)})"
+
+
+def _build_protocol_module() -> types.ModuleType:
+    protocol = types.ModuleType("vllm.entrypoints.openai.protocol")
+
+    class FunctionDefinition(_Model):
+        _fields = {"name": None, "description": None, "parameters": None}
+
+    class ChatCompletionToolsParam(_Model):
+        _fields = {"type": "function", "function": None}
+
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            if isinstance(self.function, dict):
+                self.function = FunctionDefinition(**self.function)
+
+    class ChatCompletionRequest(_Model):
+        _fields = {"model": None, "messages": [], "tools": None, "tool_choice": "auto",
+                   "skip_special_tokens": True, "request_id": None}
+
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            if self.request_id is None:
+                self.request_id = f"chatcmpl-{uuid.uuid4().hex}"
+            if self.tools is not None:
+                self.tools = [ChatCompletionToolsParam(**tool) if isinstance(tool, dict) else tool
+                              for tool in self.tools]
+
+    class FunctionCall(_Model):
+        _fields = {"name": None, "arguments": None}
+
+    class ToolCall(_Model):
+        _fields = {"id": None, "type": "function", "function": None}
+
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            if self.id is None:
+                self.id = f"chatcmpl-tool-{uuid.uuid4().hex}"
+
+    class DeltaFunctionCall(_Model):
+        _fields = {"name": None, "arguments": None}
+
+    class DeltaToolCall(_Model):
+        _fields = {"id": None, "type": None, "index": None, "function": None}
+
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            if isinstance(self.function, dict):  # pydantic would validate the dict into the model
+                self.function = DeltaFunctionCall(**self.function)
+
+    class DeltaMessage(_Model):
+        _fields = {"role": None, "content": None, "reasoning_content": None, "tool_calls": []}
+
+    class ExtractedToolCallInformation(_Model):
+        _fields = {"tools_called": False, "tool_calls": [], "content": None}
+
+    for cls in (FunctionDefinition, ChatCompletionToolsParam, ChatCompletionRequest, FunctionCall, ToolCall, DeltaFunctionCall, DeltaToolCall, DeltaMessage,
+                ExtractedToolCallInformation):
+        setattr(protocol, cls.__name__, cls)
+    return protocol
+
+
+def install_vllm_stubs() -> None:
+    """Register stand-in vLLM modules in sys.modules, unless they are already there."""
+    if "vllm.entrypoints.openai.protocol" in sys.modules:
+        return
+
+    class ToolParser:
+        def __init__(self, tokenizer):
+            self.prev_tool_call_arr = []
+            self.current_tool_id = -1
+            self.current_tool_name_sent = False
+            self.streamed_args_for_tool = []
+            self.model_tokenizer = tokenizer
+
+        @cached_property
+        def vocab(self) -> dict:
+            return self.model_tokenizer.get_vocab()
+
+    class ToolParserManager:
+        tool_parsers: dict = {}
+
+        @classmethod
+        def register_module(cls, name):
+            def register(parser_cls):
+                cls.tool_parsers[name] = parser_cls
+                return parser_cls
+            return register
+
+    class MistralTokenizer:
+        pass
+
+    modules = {name: types.ModuleType(name) for name in (
+        "vllm", "vllm.entrypoints", "vllm.entrypoints.openai", "vllm.entrypoints.openai.tool_parsers",
+        "vllm.entrypoints.openai.tool_parsers.abstract_tool_parser", "vllm.logger", "vllm.transformers_utils",
+        "vllm.transformers_utils.tokenizer", "vllm.utils")}
+    modules["vllm.entrypoints.openai.protocol"] = _build_protocol_module()
+    modules["vllm.entrypoints.openai.tool_parsers.abstract_tool_parser"].ToolParser = ToolParser
+    modules["vllm.entrypoints.openai.tool_parsers.abstract_tool_parser"].ToolParserManager = ToolParserManager
+    modules["vllm.logger"].init_logger = logging.getLogger
+    modules["vllm.transformers_utils.tokenizer"].AnyTokenizer = object
+    modules["vllm.transformers_utils.tokenizer"].MistralTokenizer = MistralTokenizer
+    modules["vllm.utils"].random_uuid = lambda: uuid.uuid4().hex
+    sys.modules.update(modules)
+
+
+def load_tool_parser(path: Path = PARSER_PATH, module_name: Optional[str] = None) -> types.ModuleType:
+    """Import a tool parser file the way `--tool-parser-plugin` does and return the module."""
+    install_vllm_stubs()
+    module_name = module_name or f"bielik_tool_parser_{abs(hash(str(path)))}"
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class StubTokenizer:
+    """Tokenizer with the Bielik tool call tags and a vocabulary of the real size.
+
+    Token strings are assigned ids as they are first seen, so recorded streams
+    can be given as lists of token strings. Like Hugging Face tokenizers,
+    `get_vocab()` builds a new dict on every call.
+    """
+
+    def __init__(self, vocab_size: int = BIELIK_VOCAB_SIZE):
+        self._ids: dict[str, int] = {"<unk>": 0, "<s>": 1, "</s>": 2, TOOL_CALL_START: 3, TOOL_CALL_END: 4}
+        for filler in range(len(self._ids), vocab_size):
+            self._ids[f"<filler_{filler}>"] = filler
+        self._tokens: list[str] = list(self._ids)
+
+    def get_vocab(self) -> dict[str, int]:
+        return dict(self._ids)
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def token_id(self, token: str) -> int:
+        token_id = self._ids.get(token)
+        if token_id is None:
+            token_id = self._ids[token] = len(self._tokens)
+            self._tokens.append(token)
+        return token_id
+
+    def encode_tokens(self, tokens: Iterable[str]) -> list[int]:
+        return [self.token_id(token) for token in tokens]
+
+    def decode(self, token_ids: Iterable[int], skip_special_tokens: bool = False) -> str:
+        return "".join(self._tokens[token_id] for token_id in token_ids)
+
+
+def split_text(text: str) -> list[str]:
+    """Split a completion into token strings, keeping the tool call tags as single tokens."""
+    return _TEXT_TOKENS.findall(text)
+
+
+def load_traces(path: Path = TRACES_PATH, names: Optional[Iterable[str]] = None) -> list[dict]:
+    """Read recorded token streams, one `{"name": ..., "tokens": [...]}` object per line.
+
+    Completions stored as `{"name": ..., "text": ...}` are split with `split_text()`.
+    """
+    with open(path, encoding="utf-8") as f:
+        traces = [json.loads(line) for line in f if line.strip()]
+    for trace in traces:
+        if "tokens" not in trace:
+            trace["tokens"] = split_text(trace["text"])
+    if names:
+        wanted = set(names)
+        traces = [trace for trace in traces if trace["name"] in wanted]
+    return traces
+
+
+def fixed_chunks(size: int) -> Callable[[int], list[int]]:
+    """Deltas of `size` tokens each, as produced by multi-step scheduling."""
+    def chunks(token_count: int) -> list[int]:
+        return [min(size, token_count - start) for start in range(0, token_count, size)]
+    return chunks
+
+
+def finish_delta(parser, delta):
+    """What vLLM's OpenAI server sends in place of the delta that finishes a request.
+
+    When that delta has tool call arguments, vLLM (serving_chat.py) takes
+    them off the end of `streamed_args_for_tool[i]` for the last tool call,
+    drops the rest from json.dumps of `prev_tool_call_arr[i]["arguments"]`
+    and sends only what is left, as the arguments of tool call i. The name
+    and content of that delta are not sent.
+    """
+    if delta is None or not delta.tool_calls or delta.tool_calls[0].function is None \
+            or delta.tool_calls[0].function.arguments is None:
+        return delta
+    from vllm.entrypoints.openai.protocol import DeltaFunctionCall, DeltaMessage, DeltaToolCall
+    tool_calls = parser.prev_tool_call_arr
+    index = len(tool_calls) - 1 if tool_calls else 0
+    latest_delta_len = len(delta.tool_calls[0].function.arguments)
+    expected_call = json.dumps(tool_calls[index].get("arguments", {}), ensure_ascii=False)
+    actual_call = parser.streamed_args_for_tool[index]
+    if latest_delta_len > 0:
+        actual_call = actual_call[:-latest_delta_len]
+    remaining_call = expected_call.replace(actual_call, "", 1)
+    return DeltaMessage(tool_calls=[DeltaToolCall(
+        index=index, function=DeltaFunctionCall(arguments=remaining_call).model_dump(exclude_none=True))])
+
+
+def replay_stream(parser, tokenizer: StubTokenizer, token_ids: list[int], request,
+                  chunks: Callable[[int], list[int]] = fixed_chunks(1),
+                  on_delta: Optional[Callable] = None, finish: bool = False) -> list:
+    """Feed a token stream through parser.extract_tool_calls_streaming, delta by delta.
+
+    `chunks(len(token_ids))` gives the number of tokens in each delta. The
+    arguments are built like vLLM's OpenAI server builds them. `on_delta`, if
+    given, is called instead of the parser with the same arguments and must
+    return the parser's result; the benchmark uses it to time each call.
+    With `finish` the last delta is replaced by `finish_delta()`, as vLLM
+    does when the stream ends there (a stop token or max_tokens).
+    Returns the DeltaMessage (or None) of every delta.
+    """
+    call = on_delta or parser.extract_tool_calls_streaming
+    previous_text, previous_token_ids = "", []
+    deltas = []
+    position = 0
+    for size in chunks(len(token_ids)):
+        delta_token_ids = token_ids[position:position + size]
+        position += size
+        delta_text = tokenizer.decode(delta_token_ids)
+        current_text = previous_text + delta_text
+        current_token_ids = previous_token_ids + delta_token_ids
+        deltas.append(call(previous_text, current_text, delta_text, previous_token_ids, current_token_ids,
+                           delta_token_ids, request))
+        previous_text, previous_token_ids = current_text, current_token_ids
+    if finish and deltas:
+        deltas[-1] = finish_delta(parser, deltas[-1])
+    return deltas
+
+
+def collect_stream(deltas: Iterable) -> tuple[str, list[dict]]:
+    """Concatenate streamed deltas into (content, [{"name", "arguments"}, ...]) like an OpenAI client does."""
+    content = []
+    tool_calls: dict[int, dict] = {}
+    for delta in deltas:
+        if delta is None:
+            continue
+        if delta.content:
+            content.append(delta.content)
+        for tool_call in delta.tool_calls or ():
+            entry = tool_calls.setdefault(tool_call.index, {"name": "", "arguments": ""})
+            function = tool_call.function
+            if function is None:
+                continue
+            entry["name"] += function.name or ""
+            entry["arguments"] += function.arguments or ""
+    return "".join(content), [tool_calls[index] for index in sorted(tool_calls)]
+
+
+def new_request(tools: Optional[list] = None):
+    """A ChatCompletionRequest with the weather tools, as the examples send it."""
+    from vllm.entrypoints.openai.protocol import ChatCompletionRequest
+    return ChatCompletionRequest(model="Bielik-11B-v2.5-Instruct", tools=TOOLS if tools is None else tools,
+                                 request_id=f"chatcmpl-replay-{next(_request_counter)}")
@@ -0,0 +1,80 @@
+"""Microbenchmark of the JSON backends the Bielik tool parser can use.
+
+The parser decodes tool call arguments with msgspec when it is installed and
+with the standard library otherwise (see BIELIK_TOOL_PARSER_JSON in
+tools/bielik_vllm_tool_parser.py). This script times the parser's own decode
+function for every available backend, its standard library fallback included,
+on typical Bielik tool call arguments, and checks each returns what the json
+module does: the same values, which `json.dumps` turns into the same text.
+
+    python benchmarks/json_backends.py --number 20000
+"""
+import argparse
+import json
+import timeit
+
+import harness
+
+payloads = {
+    "current_weather": json.dumps({"location": "Końskie, świętokrzyskie"}, ensure_ascii=False),
+    "forecast": json.dumps({"location": "Kielce", "num_days": 3}, ensure_ascii=False),
+    "forecast_result": json.dumps({
+        "forecast": [{"day": i + 1, "temperature": f"{20 + i}°C", "weather": ("deszczowo", "pochmurno", "wietrznie i słonecznie")[i % 3]}
+                     for i in range(14)],
+        "location": "Kielce",
+        "num_days": 14,
+    }, ensure_ascii=False),
+    "sql": json.dumps({
+        "query": "SELECT miasto, AVG(temperatura) AS średnia FROM pomiary WHERE data >= '2024-06-01' "
+                 "AND województwo = 'świętokrzyskie' GROUP BY miasto ORDER BY średnia DESC LIMIT 20;",
+        "timeout_s": 30,
+        "dry_run": False,
+    }, ensure_ascii=False),
+    "document": json.dumps({
+        "title": "Atrakcje turystyczne Warszawy",
+        "content": "Zamek Królewski, Łazienki Królewskie, Pałac Kultury i Nauki, Stare Miasto. " * 60,
+        "tags": ["zabytki", "muzea", "parki", "gastronomia"],
+    }, ensure_ascii=False),
+    # integers over 64 bits must stay integers, vLLM sends json.dumps of the decoded arguments
+    "big_int": json.dumps({"account": 48763342210455912345, "amount": -184467440737095516160, "currency": "PLN"}),
+}
+
+
+def available_backends():
+    module = harness.load_tool_parser()
+    backends = {}
+    for name in ("json", "msgspec"):
+        selected, loads = module._select_json_backend(name)
+        if selected == name:
+            backends[name] = loads
+    return backends
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=20000, help="calls per payload and backend")
+    args = parser.parse_args()
+
+    backends = available_backends()
+    if "msgspec" not in backends:
+        print("msgspec is not installed, skipped")
+
+    header = f"{'payload':<18}{'bytes':>7}" + "".join(f"{name:>12}" for name in backends) + "   speedup"
+    print(header)
+    print("-" * len(header))
+    for payload_name, payload in payloads.items():
+        expected = json.dumps(json.loads(payload), ensure_ascii=False)
+        timings = {}
+        for backend_name, loads in backends.items():
+            if json.dumps(loads(payload), ensure_ascii=False) != expected:
+                raise SystemExit(f"{backend_name} decodes {payload_name} differently from the json module")
+            seconds = min(timeit.repeat(lambda: loads(payload), number=args.number, repeat=3))
+            timings[backend_name] = seconds / args.number * 1e6
+        best = min(timings, key=timings.get)
+        print(f"{payload_name:<18}{len(payload.encode()):>7}"
+              + "".join(f"{timings[name]:>10.2f}us" for name in backends)
+              + f"   {timings['json'] / timings[best]:.1f}x ({best})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""Load generator for Bielik tool calling on an OpenAI-compatible endpoint.
+
+Sends the weather prompts of the tool calling examples, with their tools,
+as streamed requests and reports percentiles of time to first token,
+inter-token latency, time to first tool call and output tokens/s, plus the
+error rate. Closed loop keeps `--concurrency` requests in flight; open loop
+sends `--rate` requests per second (Poisson arrivals) however slowly the
+server answers:
+
+    python benchmarks/load.py --base-url http://127.0.0.1:8000/v1 --concurrency 64 --requests 1000
+    python benchmarks/load.py --mode open --rate 20 --duration 60
+
+`--mock` runs against benchmarks/mock_server.py started in this process,
+and `--record` saves the streams received, for the mock to replay.
+`--mock-parser` makes the mock run the raw token traces through the tool
+parser instead, so the run includes the parser's cost:
+
+    python benchmarks/load.py --mock --concurrency 32 --requests 500
+    python benchmarks/load.py --mock-parser --concurrency 32 --requests 500
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "examples"))
+
+import mock_server  # noqa: E402
+
+PROMPTS = [
+    "A tak w ogóle to jaka dziś pogoda na dworze w Końskich?",
+    "A jaka będzie pogoda przez najbliższe 3 dni w Kielcach? Prognozę podaj w tabelce.",
+    "Czy jutro w Kielcach przyda mi się parasol?",
+    "Jaka jest pogoda w Krakowie i w Gdańsku?",
+    "Wymyśl i napisz mi krótkie motywujące zdanie na dziś",
+]
+
+
+class LoadStats:
+    """Measurements of every request of a run."""
+
+    def __init__(self):
+        self.ttft = []
+        self.inter_token = []
+        self.first_tool_call = []
+        self.tokens_per_second = []  # per request, after the first token
+        self.output_tokens = 0
+        self.completed = 0
+        self.errors = {}  # exception type -> count
+
+    def add_error(self, error):
+        name = type(error).__name__
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self, elapsed):
+        failed = sum(self.errors.values())
+        metrics = {"ttft_ms": [value * 1e3 for value in self.ttft],
+                   "inter_token_ms": [value * 1e3 for value in self.inter_token],
+                   "first_tool_call_ms": [value * 1e3 for value in self.first_tool_call],
+                   "tokens_per_second": self.tokens_per_second}
+        return {
+            "requests": self.completed + failed,
+            "errors": failed,
+            "error_rate": failed / max(self.completed + failed, 1),
+            "errors_by_type": self.errors,
+            "elapsed_s": elapsed,
+            "requests_per_second": self.completed / elapsed,
+            "output_tokens_per_second": self.output_tokens / elapsed,
+            **{name: percentiles(values) for name, values in metrics.items()},
+        }
+
+
+def percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return {f"p{p}": ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)] for p in (50, 90, 99)} | {
+        "mean": sum(ordered) / len(ordered), "count": len(ordered)}
+
+
+async def measure_request(client, model, prompt, tools, stats, max_tokens, recorder=None):
+    started = time.perf_counter()
+    first = last = first_tool_call = None
+    tokens = usage_tokens = 0
+    chunks = [] if recorder is not None else None
+    try:
+        stream = await client.chat.completions.create(
+            model=model, messages=[{"role": "user", "content": prompt}], tools=tools, tool_choice="auto",
+            max_tokens=max_tokens, temperature=0.2, stream=True, stream_options={"include_usage": True})
+        async for chunk in stream:
+            now = time.perf_counter()
+            if chunks is not None:
+                chunks.append(chunk.model_dump(mode="json", exclude={"id", "created", "model"}, exclude_none=True))
+            if chunk.usage:
+                usage_tokens = chunk.usage.completion_tokens
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if not (delta.content or delta.tool_calls or getattr(delta, "reasoning_content", None)):
+                continue
+            tokens += 1
+            if first is None:
+                first = now
+                stats.ttft.append(now - started)
+            else:
+                stats.inter_token.append(now - last)
+            last = now
+            if delta.tool_calls and first_tool_call is None:
+                first_tool_call = now
+                stats.first_tool_call.append(now - started)
+    except Exception as e:
+        stats.add_error(e)
+        return
+    stats.completed += 1
+    # the tool parser holds back tokens, so chunks undercount the tokens of tool calls
+    tokens = usage_tokens or tokens
+    stats.output_tokens += tokens
+    if first is not None and last > first:
+        stats.tokens_per_second.append((tokens - 1) / (last - first))
+    if chunks is not None:
+        recorder.append({"name": f"recorded_{len(recorder)}", "chunks": [
+            chunk for chunk in chunks if chunk.get("choices")]})
+
+
+async def closed_loop(send, concurrency, requests, deadline):
+    counter = itertools.count()
+
+    async def worker():
+        while (index := next(counter)) < requests and time.perf_counter() < deadline:
+            await send(index)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def open_loop(send, rate, requests, deadline):
+    in_flight = set()
+    for index in range(requests):
+        await asyncio.sleep(random.expovariate(rate))
+        if time.perf_counter() >= deadline:
+            break
+        task = asyncio.create_task(send(index))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    await asyncio.gather(*in_flight)
+
+
+async def run(args):
+    from async_client import create_client
+    from tool_calling_streaming import tools
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # one line per request otherwise
+
+    listener = None
+    base_url = args.base_url
+    if args.mock_parser:
+        server = mock_server.ParserMockServer(mock_server.harness.load_traces(), token_rate=1 / args.mock_token_interval,
+                                              ttft=args.mock_ttft)
+    elif args.mock:
+        server = mock_server.MockServer(mock_server.load_recordings(args.recordings), ttft=args.mock_ttft,
+                                        token_interval=args.mock_token_interval)
+    if args.mock or args.mock_parser:
+        listener = await server.start("127.0.0.1", 0)
+        base_url = f"http://127.0.0.1:{listener.sockets[0].getsockname()[1]}/v1"
+
+    # open loop must not queue in the client's connection pool
+    client = create_client(base_url, max_connections=args.concurrency if args.mode == "closed" else 4096)
+    stats = LoadStats()
+    recorder = [] if args.record else None
+
+    async def send(index):
+        await measure_request(client, args.model, PROMPTS[index % len(PROMPTS)], tools, stats, args.max_tokens,
+                              recorder)
+
+    started = time.perf_counter()
+    deadline = started + args.duration if args.duration else float("inf")
+    try:
+        if args.mode == "closed":
+            await closed_loop(send, args.concurrency, args.requests, deadline)
+        else:
+            await open_loop(send, args.rate, args.requests, deadline)
+    finally:
+        elapsed = time.perf_counter() - started
+        await client.close()
+        if listener is not None:
+            listener.close()
+
+    if recorder:
+        with open(args.record, "w", encoding="utf-8") as f:
+            for recording in recorder:
+                f.write(json.dumps(recording, ensure_ascii=False) + "\n")
+    return stats.summary(elapsed)
+
+
+def print_summary(summary):
+    print(f"{summary['requests']} requests in {summary['elapsed_s']:.1f}s, {summary['requests_per_second']:.1f} req/s, "
+          f"{summary['output_tokens_per_second']:.0f} output tokens/s, "
+          f"{summary['errors']} errors ({summary['error_rate']:.1%}) {summary['errors_by_type'] or ''}")
+    header = f"{'':<22}{'p50':>10}{'p90':>10}{'p99':>10}{'mean':>10}{'count':>8}"
+    print(header)
+    print("-" * len(header))
+    for name in ("ttft_ms", "inter_token_ms", "first_tool_call_ms", "tokens_per_second"):
+        values = summary[name]
+        if values is None:
+            print(f"{name:<22}{'-':>10}")
+            continue
+        print(f"{name:<22}" + "".join(f"{values[key]:>10.1f}" for key in ("p50", "p90", "p99", "mean"))
+              + f"{values['count']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000/v1")
+    parser.add_argument("--model", default="Bielik-11B-v2.5-Instruct")
+    parser.add_argument("--mode", choices=("closed", "open"), default="closed")
+    parser.add_argument("--concurrency", type=int, default=32, help="requests in flight (closed loop)")
+    parser.add_argument("--rate", type=float, default=10.0, help="requests per second (open loop)")
+    parser.add_argument("--requests", type=int, default=200, help="requests to send")
+    parser.add_argument("--duration", type=float, help="stop sending after this many seconds")
+    parser.add_argument("--max-tokens", type=int, default=500)
+    parser.add_argument("--mock", action="store_true", help="run against an in-process mock_server.py")
+    parser.add_argument("--mock-parser", action="store_true",
+                        help="run against an in-process mock_server.py --parser")
+    parser.add_argument("--recordings", type=Path, default=mock_server.RECORDINGS_PATH,
+                        help="streams the mock replays")
+    parser.add_argument("--mock-ttft", type=float, default=0.05)
+    parser.add_argument("--mock-token-interval", type=float, default=0.02)
+    parser.add_argument("--record", type=Path, help="save the received streams for mock_server.py")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+    if args.duration:
+        args.requests = sys.maxsize if args.requests == parser.get_default("requests") else args.requests
+
+    summary = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
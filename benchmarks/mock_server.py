@@ -0,0 +1,263 @@
+"""OpenAI-compatible mock of a vLLM server, for running the examples and benchmarks/load.py offline.
+
+By default it answers streamed POST /v1/chat/completions requests by
+replaying recorded chunk streams (one `{"name": ..., "chunks": [...]}`
+object per line, as written by `load.py --record`) in turn, after `--ttft`
+seconds and then one chunk every `--token-interval` seconds:
+
+    python benchmarks/mock_server.py --port 8001 --token-interval 0.02
+    python benchmarks/load.py --base-url http://127.0.0.1:8001/v1 --concurrency 32
+
+With `--parser` it generates the raw Bielik token streams of
+benchmarks/traces instead, at `--token-rate` tokens per second, and runs
+them through the real BielikToolParser with a stub tokenizer, the way vLLM
+does, streamed or not, cut at the request's max_tokens. Requests with tools
+get the traces with tool calls, other requests (and the answers after tool
+results) the plain text ones:
+
+    python benchmarks/mock_server.py --parser --token-rate 40
+    python examples/tool_calling_streaming.py   # with base_url on port 8001
+
+It speaks just enough HTTP/1.1 (keep-alive, chunked server-sent events) for
+the OpenAI client.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+import harness
+
+RECORDINGS_PATH = Path(__file__).resolve().parent / "traces" / "openai_streams.jsonl"
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found"}
+
+
+def load_recordings(path: Path = RECORDINGS_PATH) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def delta_chunk(delta: Optional[dict] = None, finish_reason: Optional[str] = None) -> dict:
+    """A chat.completion.chunk as vLLM streams it, without the per-request fields."""
+    return {"object": "chat.completion.chunk",
+            "choices": [{"index": 0, "delta": delta or {}, "logprobs": None, "finish_reason": finish_reason}]}
+
+
+class MockServer:
+    """Replays recorded chunk streams to every streamed chat completion request, in turn."""
+
+    def __init__(self, recordings: list[dict], ttft: float = 0.05, token_interval: float = 0.02):
+        self.recordings = recordings
+        self.ttft = ttft
+        self.token_interval = token_interval
+        self.requests = 0
+        self._next_recording = itertools.cycle(recordings)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8001) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self._handle_connection, host, port)
+
+    async def stream_chunks(self, body: dict) -> AsyncIterator[tuple[dict, int]]:
+        """The chunks of the response to `body` with the tokens in each, paced like a server generating them."""
+        await asyncio.sleep(self.ttft)
+        for index, chunk in enumerate(next(self._next_recording)["chunks"]):
+            if index:
+                await asyncio.sleep(self.token_interval)
+            yield chunk, 1
+
+    async def complete(self, body: dict) -> Optional[dict]:
+        """The whole response to a request without `stream`, or None if not mocked."""
+        return None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                if method != "POST" or not path.endswith("/chat/completions"):
+                    await self._send_json(writer, 404, {"error": {"message": f"{method} {path} is not mocked"}})
+                    continue
+                request = json.loads(body)
+                if request.get("stream"):
+                    await self._stream(writer, request)
+                    continue
+                self.requests += 1
+                response = await self.complete(request)
+                if response is None:
+                    await self._send_json(writer, 400, {"error": {"message": "only streamed requests are mocked"}})
+                else:
+                    await self._send_json(writer, 200, {"id": f"chatcmpl-mock-{self.requests}",
+                                                        "created": int(time.time()), **response})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: dict) -> None:
+        data = json.dumps(payload).encode()
+        writer.write(f"HTTP/1.1 {status} {_REASONS[status]}\r\ncontent-type: application/json\r\n"
+                     f"content-length: {len(data)}\r\n\r\n".encode() + data)
+        await writer.drain()
+
+    async def _stream(self, writer: asyncio.StreamWriter, request: dict) -> None:
+        self.requests += 1
+        writer.write(b"HTTP/1.1 200 OK\r\ncontent-type: text/event-stream\r\ntransfer-encoding: chunked\r\n\r\n")
+        fields = {"id": f"chatcmpl-mock-{self.requests}", "created": int(time.time()),
+                  "model": request.get("model", "mock")}
+        completion_tokens = 0
+        async for chunk, tokens in self.stream_chunks(request):
+            completion_tokens += tokens
+            self._write_event(writer, json.dumps({**fields, **chunk}, ensure_ascii=False))
+            await writer.drain()
+        if (request.get("stream_options") or {}).get("include_usage"):
+            usage = {"prompt_tokens": 0, "completion_tokens": completion_tokens, "total_tokens": completion_tokens}
+            self._write_event(writer, json.dumps({**fields, "object": "chat.completion.chunk", "choices": [],
+                                                  "usage": usage}))
+        self._write_event(writer, "[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    def _write_event(writer: asyncio.StreamWriter, data: str) -> None:
+        event = f"data: {data}\n\n".encode()
+        writer.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+
+
+class ParserMockServer(MockServer):
+    """Answers with raw Bielik token streams run through the real BielikToolParser.
+
+    A parser is built for every request that has tools, and fed the deltas
+    of `tokens_per_delta` tokens with the arguments vLLM's OpenAI server
+    passes, so the chunks are what vLLM would stream for that completion:
+    the last delta goes through vLLM's end-of-stream check
+    (harness.finish_delta) and carries the finish reason, "length" when the
+    trace is longer than max_tokens, "tool_calls" once the parser has seen one.
+    """
+
+    def __init__(self, traces: list[dict], parser_path: Path = harness.PARSER_PATH, token_rate: float = 50.0,
+                 tokens_per_delta: int = 1, ttft: float = 0.05):
+        super().__init__([], ttft=ttft, token_interval=tokens_per_delta / token_rate)
+        self.token_rate = token_rate
+        self.tokens_per_delta = tokens_per_delta
+        self.module = harness.load_tool_parser(parser_path)
+        self.tokenizer = harness.StubTokenizer()
+        encoded = [self.tokenizer.encode_tokens(trace["tokens"]) for trace in traces]
+        start_id = self.tokenizer.token_id(harness.TOOL_CALL_START)
+        with_tools = [token_ids for token_ids in encoded if start_id in token_ids]
+        plain = [token_ids for token_ids in encoded if start_id not in token_ids]
+        if not with_tools or not plain:
+            raise ValueError("the traces need both completions with and without tool calls")
+        self._tool_call_traces = itertools.cycle(with_tools)
+        self._text_traces = itertools.cycle(plain)
+
+    def _prepare(self, body: dict):
+        """The token ids to answer `body` with, their finish reason, and the parser and request if it runs."""
+        messages = body.get("messages") or [{}]
+        calls_tools = bool(body.get("tools")) and body.get("tool_choice") != "none" \
+            and messages[-1].get("role") != "tool"
+        parser = request = None
+        if calls_tools:
+            from vllm.entrypoints.openai.protocol import ChatCompletionRequest
+            request = ChatCompletionRequest(**{key: body[key] for key in ("model", "messages", "tools", "tool_choice")
+                                               if key in body})
+            parser = self.module.BielikToolParser(self.tokenizer)
+            request = parser.adjust_request(request)
+        token_ids = next(self._tool_call_traces if calls_tools else self._text_traces)
+        max_tokens = body.get("max_completion_tokens") or body.get("max_tokens")
+        if max_tokens is not None and len(token_ids) > max_tokens:
+            return token_ids[:max_tokens], "length", parser, request
+        return token_ids, "stop", parser, request
+
+    async def stream_chunks(self, body: dict) -> AsyncIterator[tuple[dict, int]]:
+        token_ids, finish_reason, parser, request = self._prepare(body)
+        await asyncio.sleep(self.ttft)
+        yield delta_chunk({"role": "assistant", "content": ""}), 0
+        previous_text, previous_token_ids = "", []
+        for position in range(0, len(token_ids), self.tokens_per_delta):
+            if position:
+                await asyncio.sleep(self.token_interval)
+            delta_token_ids = token_ids[position:position + self.tokens_per_delta]
+            delta_text = self.tokenizer.decode(delta_token_ids)
+            current_text = previous_text + delta_text
+            current_token_ids = previous_token_ids + delta_token_ids
+            last = position + self.tokens_per_delta >= len(token_ids)
+            if parser is None:
+                delta = {"content": delta_text}
+            else:
+                message = parser.extract_tool_calls_streaming(previous_text, current_text, delta_text,
+                                                              previous_token_ids, current_token_ids,
+                                                              delta_token_ids, request)
+                if last:
+                    message = harness.finish_delta(parser, message)
+                delta = message.model_dump(exclude_none=True) if message is not None else {}
+                if not delta.get("tool_calls"):
+                    delta.pop("tool_calls", None)
+            previous_text, previous_token_ids = current_text, current_token_ids
+            if last:
+                if parser is not None and parser.prev_tool_call_arr:
+                    finish_reason = "tool_calls"
+                yield delta_chunk(delta, finish_reason), len(delta_token_ids)
+            elif delta:  # vLLM sends nothing for the tokens the parser holds back
+                yield delta_chunk(delta), len(delta_token_ids)
+
+    async def complete(self, body: dict) -> Optional[dict]:
+        token_ids, finish_reason, parser, request = self._prepare(body)
+        await asyncio.sleep(self.ttft + len(token_ids) / self.token_rate)
+        text = self.tokenizer.decode(token_ids)
+        message = {"role": "assistant", "content": text}
+        if parser is not None:
+            extracted = parser.extract_tool_calls(text, request=request)
+            if extracted.tools_called:
+                message = {"role": "assistant", "content": extracted.content,
+                           "tool_calls": [tool_call.model_dump() for tool_call in extracted.tool_calls]}
+                finish_reason = "tool_calls"
+        return {"object": "chat.completion", "model": body.get("model", "mock"),
+                "choices": [{"index": 0, "message": message, "logprobs": None, "finish_reason": finish_reason}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(token_ids), "total_tokens": len(token_ids)}}
+
+
+async def serve(server: MockServer, host: str, port: int) -> None:
+    async with await server.start(host, port) as listener:
+        print(f"Mock server on http://{host}:{port}/v1")
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recordings", type=Path, default=RECORDINGS_PATH)
+    parser.add_argument("--parser", action="store_true",
+                        help="run the raw token streams of --traces through the tool parser")
+    parser.add_argument("--traces", type=Path, default=harness.TRACES_PATH)
+    parser.add_argument("--trace", dest="trace_names", action="append",
+                        help="only this trace of --traces, can be given more than once")
+    parser.add_argument("--tool-parser", type=Path, default=harness.PARSER_PATH, help="tool parser file")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="tokens per second (--parser)")
+    parser.add_argument("--tokens-per-delta", type=int, default=1, help="tokens per streamed delta (--parser)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--ttft", type=float, default=0.05, help="seconds before the first chunk")
+    parser.add_argument("--token-interval", type=float, default=0.02, help="seconds between chunks")
+    args = parser.parse_args()
+    if args.parser:
+        server = ParserMockServer(harness.load_traces(args.traces, args.trace_names), args.tool_parser, token_rate=args.token_rate,
+                                  tokens_per_delta=args.tokens_per_delta, ttft=args.ttft)
+    else:
+        server = MockServer(load_recordings(args.recordings), ttft=args.ttft, token_interval=args.token_interval)
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Replay recorded Bielik token streams through the tool parser and report its cost.
+
+Every trace in benchmarks/traces/bielik_streams.jsonl (plain text, one tool
+call, parallel tool calls, huge arguments, malformed JSON, ...) is fed
+through `extract_tool_calls_streaming` delta by delta, and its full text
+through `extract_tool_calls`. vLLM is replaced by the stubs in harness.py, so
+this runs on any CPU-only machine:
+
+    python benchmarks/replay.py
+    python benchmarks/replay.py --chunk 4 --repeat 50 --traces huge_arguments
+    python benchmarks/replay.py --parser old_parser.py --parser tools/bielik_vllm_tool_parser.py
+    python benchmarks/replay.py --stages
+
+Reported per trace: streaming per-call latency percentiles (us), total CPU
+time of the streaming calls (ms), non-streaming latency (us), the largest
+transient allocation made by a single streaming call and the memory the
+parser still holds when the stream ends (KiB). `--stages` then replays
+all traces once more with the parser's stage metrics on
+(BIELIK_TOOL_PARSER_METRICS) and shows where the time goes.
+"""
+import argparse
+import json
+import logging
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+import harness
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def time_streaming(module, tokenizer, token_ids, chunks, repeat):
+    latencies, cpu_ns = [], 0
+    for _ in range(repeat):
+        parser = module.BielikToolParser(tokenizer)
+        extract = parser.extract_tool_calls_streaming
+
+        def timed(*args):
+            nonlocal cpu_ns
+            cpu_started, started = time.thread_time_ns(), time.perf_counter_ns()
+            delta = extract(*args)
+            latencies.append(time.perf_counter_ns() - started)
+            cpu_ns += time.thread_time_ns() - cpu_started
+            return delta
+
+        harness.replay_stream(parser, tokenizer, token_ids, harness.new_request(), chunks, on_delta=timed)
+    return sorted(latencies), cpu_ns / repeat
+
+
+def time_non_streaming(module, tokenizer, text, repeat):
+    parser = module.BielikToolParser(tokenizer)
+    request = harness.new_request()
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        parser.extract_tool_calls(text, request)
+        latencies.append(time.perf_counter_ns() - started)
+    return sorted(latencies)
+
+
+def measure_allocations(module, tokenizer, token_ids, chunks):
+    parser = module.BielikToolParser(tokenizer)
+    extract = parser.extract_tool_calls_streaming
+    largest = 0
+
+    def traced(*args):
+        nonlocal largest
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        delta = extract(*args)
+        largest = max(largest, tracemalloc.get_traced_memory()[1] - current)
+        return delta
+
+    tracemalloc.start()
+    try:
+        deltas = harness.replay_stream(parser, tokenizer, token_ids, harness.new_request(), chunks, on_delta=traced)
+        del deltas
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(True, module.__file__)])
+        retained = sum(stat.size for stat in snapshot.statistics("filename"))
+    finally:
+        tracemalloc.stop()
+    return largest, retained
+
+
+def stage_breakdown(module, tokenizer, traces, chunks, repeat):
+    """Replay the traces with a fresh BielikParserMetrics installed; returns its snapshot."""
+    previous = module.BielikToolParser.metrics
+    module.BielikToolParser.metrics = module.BielikParserMetrics()
+    try:
+        for trace in traces:
+            token_ids = tokenizer.encode_tokens(trace["tokens"])
+            for _ in range(repeat):
+                harness.replay_stream(module.BielikToolParser(tokenizer), tokenizer, token_ids, harness.new_request(),
+                                      chunks)
+                module.BielikToolParser(tokenizer).extract_tool_calls(tokenizer.decode(token_ids),
+                                                                      request=harness.new_request())
+        return module.BielikToolParser.metrics.snapshot()
+    finally:
+        module.BielikToolParser.metrics = previous
+
+
+def print_stages(snapshot):
+    header = f"{'stage':<18}{'calls':>9}{'mean us':>9}{'total ms':>10}{'of total':>10}"
+    print(header)
+    print("-" * len(header))
+    stages = snapshot["stages"]
+    for name, stage in sorted(stages.items()):
+        total = stages[name.split(".")[0] + ".total"]["sum_seconds"]
+        print(f"{name:<18}{stage['count']:>9}{stage['sum_seconds'] / max(stage['count'], 1) * 1e6:>9.2f}"
+              f"{stage['sum_seconds'] * 1e3:>10.2f}{stage['sum_seconds'] / total:>10.0%}")
+    print("  ".join(f"{name} {value}" for name, value in sorted(snapshot["counters"].items())))
+
+
+def run(parser_path, traces, chunk, repeat):
+    module = harness.load_tool_parser(parser_path)
+    tokenizer = harness.StubTokenizer()
+    chunks = harness.fixed_chunks(chunk)
+    results = []
+    for trace in traces:
+        token_ids = tokenizer.encode_tokens(trace["tokens"])
+        text = tokenizer.decode(token_ids)
+        latencies, cpu_ns = time_streaming(module, tokenizer, token_ids, chunks, repeat)
+        non_streaming = time_non_streaming(module, tokenizer, text, repeat)
+        largest, retained = measure_allocations(module, tokenizer, token_ids, chunks)
+        results.append({
+            "trace": trace["name"],
+            "tokens": len(token_ids),
+            "deltas": len(latencies) // repeat,
+            "stream_p50_us": percentile(latencies, 0.50) / 1e3,
+            "stream_p90_us": percentile(latencies, 0.90) / 1e3,
+            "stream_p99_us": percentile(latencies, 0.99) / 1e3,
+            "stream_max_us": latencies[-1] / 1e3,
+            "stream_mean_us": statistics.fmean(latencies) / 1e3,
+            "stream_cpu_ms": cpu_ns / 1e6,
+            "non_stream_p50_us": percentile(non_streaming, 0.50) / 1e3,
+            "alloc_per_call_kib": largest / 1024,
+            "retained_kib": retained / 1024,
+        })
+    return results
+
+
+def print_results(parser_path, results):
+    print(f"\n{parser_path}")
+    header = (f"{'trace':<26}{'tokens':>7}{'p50':>8}{'p90':>8}{'p99':>8}{'max':>9}"
+              f"{'cpu ms':>9}{'non-str':>9}{'alloc/call':>11}{'retained':>10}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['trace']:<26}{r['tokens']:>7}{r['stream_p50_us']:>8.1f}{r['stream_p90_us']:>8.1f}"
+              f"{r['stream_p99_us']:>8.1f}{r['stream_max_us']:>9.1f}{r['stream_cpu_ms']:>9.2f}"
+              f"{r['non_stream_p50_us']:>9.1f}{r['alloc_per_call_kib']:>10.1f}K{r['retained_kib']:>9.1f}K")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--parser", dest="parsers", action="append", type=Path,
+                        help="tool parser file to benchmark, can be given more than once "
+                             "(default: tools/bielik_vllm_tool_parser.py)")
+    parser.add_argument("--traces", nargs="*", help="names of the traces to replay (default: all)")
+    parser.add_argument("--traces-file", type=Path, default=harness.TRACES_PATH)
+    parser.add_argument("--chunk", type=int, default=1, help="tokens per streamed delta")
+    parser.add_argument("--repeat", type=int, default=20, help="replays of every trace")
+    parser.add_argument("--json", type=Path, help="also write the results to this file")
+    parser.add_argument("--stages", action="store_true", help="also show the time spent in each parser stage")
+    args = parser.parse_args()
+    # malformed traces make the parser log exceptions; keep the records but not the console noise
+    logging.getLogger().addHandler(logging.NullHandler())
+
+    traces = harness.load_traces(args.traces_file, args.traces)
+    if not traces:
+        raise SystemExit("no traces to replay")
+    report = {}
+    for parser_path in args.parsers or [harness.PARSER_PATH]:
+        results = run(parser_path, traces, args.chunk, args.repeat)
+        print_results(parser_path, results)
+        report[str(parser_path)] = results
+        module = harness.load_tool_parser(parser_path)
+        if args.stages and hasattr(module, "BielikParserMetrics"):
+            print()
+            print_stages(stage_breakdown(module, harness.StubTokenizer(), traces, harness.fixed_chunks(args.chunk),
+                                         args.repeat))
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""CPU time per structured-output answer, by way of validating it.
+
+Compares `json.loads` followed by `model_validate` with a single
+`model_validate_json` pass, msgspec, and examples/structured_stream.py fed
+the answer in streamed deltas, which validates every field as soon as it is
+complete. Every method gets the answer as the same deltas; the others collect
+and join them as any streaming client has to:
+
+    python benchmarks/structured_validation.py --chunk-size 4
+"""
+import argparse
+import json
+import sys
+import timeit
+from enum import Enum
+from pathlib import Path
+
+import msgspec
+from pydantic import BaseModel
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "examples"))
+
+from structured_stream import StructuredStreamParser  # noqa: E402
+
+
+class CarType(str, Enum):
+    sedan = "sedan"
+    suv = "SUV"
+    truck = "Truck"
+    coupe = "Coupe"
+
+
+class CarDescription(BaseModel):
+    brand: str
+    model: str
+    car_type: CarType
+
+
+class CarStruct(msgspec.Struct):
+    brand: str
+    model: str
+    car_type: CarType
+
+
+ANSWER = '{"brand": "Mazda", "model": "MX-5 Miata", "car_type": "Coupe"}'
+
+
+def joined(deltas):
+    parts = []
+    for delta in deltas:
+        parts.append(delta)
+    return "".join(parts)
+
+
+def streamed(output_model, deltas):
+    parser = StructuredStreamParser(output_model)
+    for delta in deltas:
+        parser.feed(delta)
+    return parser.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-size", type=int, default=4, help="characters per streamed delta")
+    parser.add_argument("--number", type=int, default=20000, help="answers per method")
+    args = parser.parse_args()
+
+    deltas = [ANSWER[i:i + args.chunk_size] for i in range(0, len(ANSWER), args.chunk_size)]
+    decode_struct = msgspec.json.Decoder(type=CarStruct).decode
+    methods = {
+        "json.loads + model_validate": lambda: CarDescription.model_validate(json.loads(joined(deltas))),
+        "model_validate_json": lambda: CarDescription.model_validate_json(joined(deltas)),
+        "msgspec Struct": lambda: decode_struct(joined(deltas)),
+        f"streamed, pydantic ({len(deltas)} deltas)": lambda: streamed(CarDescription, deltas),
+        f"streamed, msgspec ({len(deltas)} deltas)": lambda: streamed(CarStruct, deltas),
+    }
+    for name, method in methods.items():
+        per_answer = min(timeit.repeat(method, number=args.number, repeat=3)) / args.number * 1e6
+        print(f"{name:<36}{per_answer:>8.2f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import argparse
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from openai import AsyncOpenAI
+
+from stream_aggregator import StreamAggregator
+from tool_executor import StreamingToolExecutor
+
+
+def create_client(base_url="http://127.0.0.1:8000/v1", api_key="EMPTY", max_connections=256, keepalive_expiry=60.0,
+                  timeout=600.0):
+    # one connection pool for every conversation; connections are kept alive
+    # between requests instead of opening a new one for each turn
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                            keepalive_expiry=keepalive_expiry),
+        timeout=httpx.Timeout(timeout, connect=10.0),
+    )
+    return AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+
+
+class BielikAsyncClient:
+    """Drives many Bielik conversations at once from one process.
+
+    All requests share one AsyncOpenAI client and its keep-alive connection
+    pool, and at most `max_concurrency` of them are in flight at a time; the
+    rest wait for a free slot instead of overloading the vLLM server. Tools run
+    in one shared thread pool, each as soon as its arguments are complete.
+    """
+
+    def __init__(self, model="Bielik-11B-v2.5-Instruct", base_url="http://127.0.0.1:8000/v1", api_key="EMPTY",
+                 max_concurrency=128, tool_workers=32):
+        self.model = model
+        self.client = create_client(base_url, api_key, max_connections=max_concurrency)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tool_pool = ThreadPoolExecutor(max_workers=tool_workers, thread_name_prefix="tool")
+
+    async def stream_turn(self, messages, tool_executor=None, on_content=None, **kwargs):
+        """Send `messages` and stream the answer; returns the assistant message dict."""
+        async with self._semaphore:
+            stream = await self.client.chat.completions.create(model=self.model, messages=messages, stream=True,
+                                                               **kwargs)
+            return await process_streamed_response(stream, tool_executor=tool_executor, on_content=on_content)
+
+    async def add_turn(self, prompt, messages, tools=None, call_function=None, on_content=None, **kwargs):
+        """One user turn, with a second request for the answer when the model calls tools."""
+        messages.append({"role": "user", "content": prompt})
+        if tools:
+            kwargs.update(tools=tools, tool_choice="auto")
+        if not call_function:
+            messages.append(await self.stream_turn(messages, on_content=on_content, **kwargs))
+            return
+
+        with StreamingToolExecutor(call_function, executor=self._tool_pool) as tool_executor:
+            assistant_message = await self.stream_turn(messages, tool_executor=tool_executor, on_content=on_content,
+                                                       **kwargs)
+            messages.append(assistant_message)
+            # the tools started while the response was streaming; wait for their futures on the
+            # event loop, so results() below no longer blocks
+            await asyncio.gather(*(asyncio.wrap_future(future) for future in tool_executor.futures()))
+            tool_messages = tool_executor.results()
+        if assistant_message.get("tool_calls"):
+            messages.extend(tool_messages)
+            messages.append(await self.stream_turn(messages, on_content=on_content, **kwargs))
+
+    async def aclose(self):
+        await self.client.close()
+        self._tool_pool.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+
+async def process_streamed_response(stream, tool_executor=None, on_content=None):
+    """Async version of process_streamed_response from the examples.
+
+    Collects content, reasoning (`reasoning_content`, sent by vLLM's reasoning
+    parser) and tool calls from the stream. Tool call deltas are also passed
+    to `tool_executor`, and content to `on_content(kind, text)` with kind
+    "content" or "reasoning".
+    """
+    aggregator = StreamAggregator()
+    # read the stream to the end even after finish_reason, so the connection
+    # goes back to the pool instead of being closed
+    async for chunk in stream:
+        delta = aggregator.add(chunk)
+        if delta is None:
+            continue
+        if on_content:
+            reasoning = getattr(delta, "reasoning_content", None)
+            if reasoning:
+                on_content("reasoning", reasoning)
+            if delta.content:
+                on_content("content", delta.content)
+        if delta.tool_calls and tool_executor is not None:
+            tool_executor.feed(delta.tool_calls)
+    return aggregator.message()
+
+
+async def run_conversation(client, prompts, tools=None, call_function=None):
+    messages = []
+    for prompt in prompts:
+        await client.add_turn(prompt, messages, tools=tools, call_function=call_function, max_tokens=500,
+                              temperature=0.2)
+    return messages
+
+
+async def main():
+    from tool_calling_streaming import call_function, tools
+
+    parser = argparse.ArgumentParser(description="Run many Bielik tool calling conversations at once.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000/v1")
+    parser.add_argument("--model", default="Bielik-11B-v2.5-Instruct")
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=128, help="requests in flight at the same time")
+    args = parser.parse_args()
+
+    prompts = [
+        "A tak w ogóle to jaka dziś pogoda na dworze w Końskich?",
+        "A jaka będzie pogoda przez najbliższe 3 dni w Kielcach? Prognozę podaj w tabelce.",
+    ]
+    started = time.perf_counter()
+    async with BielikAsyncClient(args.model, args.base_url, max_concurrency=args.concurrency) as client:
+        results = await asyncio.gather(
+            *(run_conversation(client, prompts, tools, call_function) for _ in range(args.conversations)),
+            return_exceptions=True)
+    elapsed = time.perf_counter() - started
+
+    failed = [result for result in results if isinstance(result, Exception)]
+    for error in failed[:5]:
+        logging.error(f"Conversation failed: {error!r}")
+    turns = (len(results) - len(failed)) * len(prompts)
+    logging.info(f"{args.conversations} conversations ({len(failed)} failed), {turns} turns in {elapsed:.1f}s "
+                 f"({turns / elapsed:.1f} turns/s)")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    asyncio.run(main())
@@ -0,0 +1,22 @@
+"""The output models of the structured output examples.
+
+Kept apart from the example scripts, so the process pool workers of
+structured_batch.py import only the models (unpickling a model class imports
+its module) and not the logging setup and client of structured_output.py.
+"""
+from enum import Enum
+
+from pydantic import BaseModel
+
+
+class CarType(str, Enum):
+    sedan = "sedan"
+    suv = "SUV"
+    truck = "Truck"
+    coupe = "Coupe"
+
+
+class CarDescription(BaseModel):
+    brand: str
+    model: str
+    car_type: CarType
@@ -0,0 +1,204 @@
+import json
+import logging
+
+DEFAULT_TOKENIZER = "speakleash/Bielik-11B-v2.5-Instruct"
+# <|im_start|>role\n ... <|im_end|>\n around every message in the chat template
+MESSAGE_OVERHEAD_TOKENS = 5
+
+
+def bielik_token_counter(model=DEFAULT_TOKENIZER):
+    """Token counter with the Bielik tokenizer, or a rough estimate when transformers is not installed."""
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model)
+    except Exception as e:  # not installed, or no access to the model
+        logging.warning(f"Bielik tokenizer not available ({e}), estimating tokens from the text length")
+        return lambda text: len(text) // 3 + 1
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+
+
+class ConversationHistory(list):
+    """The messages of a conversation, kept within a token budget.
+
+    Used in place of the `messages` list of the examples. Every message is
+    counted once when it is added; all list operations (insert, `+=`, pop,
+    slice assignment, ...) keep the counts in step with the messages. When
+    adding a message takes the history over `budget` tokens, it is compacted
+    in one go down to `low_water` of the budget:
+    first the results of old tool calls are summarised (or cut short), then
+    the oldest turns are dropped. Between compactions, messages are only ever
+    appended, so the prompt sent to vLLM keeps a stable prefix and prefix
+    caching keeps hitting. The system message and the last `keep_turns` turns
+    are never touched; when they alone are over the budget, compaction waits
+    until a new turn moves older messages out of them.
+
+    `summarise(message)`, if given, returns the text that replaces the content
+    of an old tool result, e.g. a one-line summary made by the model.
+    """
+
+    def __init__(self, messages=(), budget=4000, count_tokens=None, keep_turns=2, low_water=0.75,
+                 tool_result_chars=160, summarise=None):
+        super().__init__()
+        self.budget = budget
+        self.count_tokens = count_tokens or bielik_token_counter()
+        self.keep_turns = keep_turns
+        self.low_water = low_water
+        self.tool_result_chars = tool_result_chars
+        self.summarise = summarise
+        self.compactions = 0
+        self._tokens = []  # token count of every message, in step with the list
+        self._compacted = []  # whether the message was already shortened
+        self._incompressible_from = None  # protected start when compaction last could not get under the target
+        self.extend(messages)
+
+    @property
+    def tokens(self):
+        return sum(self._tokens)
+
+    def append(self, message):
+        super().append(message)
+        self._tokens.append(self._count(message))
+        self._compacted.append(False)
+        self._check_budget()
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    def __iadd__(self, messages):
+        self.extend(messages)
+        return self
+
+    def __imul__(self, count):
+        messages = list(self)
+        if count <= 0:
+            self.clear()
+        for _ in range(count - 1):
+            self.extend(messages)
+        return self
+
+    def insert(self, index, message):
+        super().insert(index, message)
+        self._tokens.insert(index, self._count(message))
+        self._compacted.insert(index, False)
+        self._check_budget()
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = list(value)
+            super().__setitem__(index, value)
+            self._tokens[index] = [self._count(message) for message in value]
+            self._compacted[index] = [False] * len(value)
+        else:
+            super().__setitem__(index, value)
+            self._tokens[index] = self._count(value)
+            self._compacted[index] = False
+        self._check_budget()
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        del self._tokens[index]
+        del self._compacted[index]
+
+    def pop(self, index=-1):
+        message = super().pop(index)
+        del self._tokens[index]
+        del self._compacted[index]
+        return message
+
+    def remove(self, message):
+        del self[self.index(message)]
+
+    def clear(self):
+        super().clear()
+        self._tokens.clear()
+        self._compacted.clear()
+        self._incompressible_from = None
+
+    def reverse(self):
+        super().reverse()
+        self._tokens.reverse()
+        self._compacted.reverse()
+
+    def sort(self, *, key=None, reverse=False):
+        order = sorted(range(len(self)), key=lambda index: key(self[index]) if key else self[index], reverse=reverse)
+        messages, tokens, compacted = list(self), self._tokens, self._compacted
+        super().__setitem__(slice(None), [messages[index] for index in order])
+        self._tokens = [tokens[index] for index in order]
+        self._compacted = [compacted[index] for index in order]
+
+    def compact(self):
+        target = int(self.budget * self.low_water)
+        protected = self._protected_from()
+        tokens_before = self.tokens
+
+        # old tool results first, they are the bulk of a tool loop
+        for index in range(protected):
+            if self.tokens <= target:
+                break
+            message = self[index]
+            if message.get("role") == "tool" and not self._compacted[index]:
+                self._shorten_at(index)
+
+        # then whole turns, oldest first, so tool calls keep their results
+        while self.tokens > target:
+            start = 1 if self and self[0].get("role") == "system" else 0
+            end = self._next_turn(start)
+            if end is None or end > self._protected_from():
+                break
+            del self[start:end]
+
+        self.compactions += 1
+        logging.info(f"Compacted conversation history from {tokens_before} to {self.tokens} tokens")
+        if self.tokens > target:
+            # only the protected messages are left; trying again before they
+            # change would drop nothing
+            self._incompressible_from = self._protected_from()
+            if self.tokens > self.budget:
+                logging.warning(f"The last {self.keep_turns} turns alone take {self.tokens} tokens, "
+                                f"compaction waits for the next turn")
+
+    def _check_budget(self):
+        if self.tokens > self.budget and self._protected_from() != self._incompressible_from:
+            self.compact()
+
+    def _count(self, message):
+        text = message.get("content") or ""
+        if not isinstance(text, str):
+            text = json.dumps(text, ensure_ascii=False)
+        for tool_call in message.get("tool_calls") or ():
+            function = tool_call.get("function", {})
+            text += f'<tool_call>{{"name": "{function.get("name", "")}", "arguments": {function.get("arguments", "")}}}</tool_call>'
+        return self.count_tokens(text) + MESSAGE_OVERHEAD_TOKENS
+
+    def _shorten_at(self, index):
+        message = self[index]
+        message = {**message, "content": self._shorten(message)}
+        super().__setitem__(index, message)
+        self._tokens[index] = self._count(message)
+        self._compacted[index] = True
+
+    def _shorten(self, message):
+        if self.summarise is not None:
+            return self.summarise(message)
+        content = message.get("content") or ""
+        if len(content) <= self.tool_result_chars:
+            return content
+        return f"{content[:self.tool_result_chars]}… [{len(content) - self.tool_result_chars} more characters omitted]"
+
+    def _next_turn(self, start):
+        """Index of the user message after the turn starting at `start`."""
+        for index in range(start + 1, len(self)):
+            if self[index].get("role") == "user":
+                return index
+        return None
+
+    def _protected_from(self):
+        """Index of the first message of the last `keep_turns` turns."""
+        turns = 0
+        for index in range(len(self) - 1, -1, -1):
+            if self[index].get("role") == "user":
+                turns += 1
+                if turns == self.keep_turns:
+                    return index
+        return 0
@@ -0,0 +1,114 @@
+import bisect
+import logging
+
+from reasoning_splitter import MemorySink, ReasoningSplitter
+from stream_aggregator import StreamAggregator
+
+DEFAULT_BUCKETS = (128, 256, 512, 1024, 2048, 4096, 8192)
+
+
+class ReasoningBudget:
+    """Caps the reasoning of streamed requests at `max_reasoning_tokens`.
+
+    Reasoning tokens are counted as they stream (one per delta, which is how
+    vLLM streams them, unless `count_tokens(text)` is given). When a response
+    reaches the budget before its answer has started, the stream is closed,
+    which makes vLLM abort the request and free its slot. A follow-up request
+    then continues an assistant message holding the truncated reasoning and a
+    closing `</think>` (`continue_final_message` in vLLM), so the model has
+    to answer right away.
+
+    The reasoning length of every request is recorded; `report()` shows a
+    histogram for tuning the budget.
+    """
+
+    def __init__(self, max_reasoning_tokens=1024, answer_max_tokens=1000, count_tokens=None,
+                 buckets=DEFAULT_BUCKETS):
+        self.max_reasoning_tokens = max_reasoning_tokens
+        self.answer_max_tokens = answer_max_tokens
+        self.count_tokens = count_tokens
+        self.buckets = buckets
+        self.reasoning_tokens = []  # per request
+        self.time_to_first_reasoning = []  # per request that reasoned, in seconds
+        self.truncated = 0
+
+    def complete(self, create, messages, on_content=None, **kwargs):
+        """Stream a response with `create(**kwargs)` within the budget; returns the assistant message dict.
+
+        `on_content(kind, text)` gets the streamed text, with kind "reasoning" or "content".
+        """
+        splitter = ReasoningSplitter(MemorySink())  # bounded by the budget
+        stream = create(messages=messages, stream=True, **kwargs)
+        tokens = 0
+        truncated = False
+        for chunk in stream:
+            delta = splitter.add(chunk)
+            if delta is None:
+                continue
+            reasoning = getattr(delta, "reasoning_content", None)
+            if reasoning:
+                if on_content:
+                    on_content("reasoning", reasoning)
+                tokens += self.count_tokens(reasoning) if self.count_tokens else 1
+                if tokens >= self.max_reasoning_tokens and splitter.time_to_first_answer is None:
+                    stream.close()  # vLLM aborts the request when the client disconnects
+                    truncated = True
+                    break
+            if delta.content and on_content:
+                on_content("content", delta.content)
+            if splitter.finish_reason:
+                break
+
+        self.reasoning_tokens.append(tokens)
+        if splitter.time_to_first_reasoning is not None:
+            self.time_to_first_reasoning.append(splitter.time_to_first_reasoning)
+        if not truncated:
+            return splitter.message()
+
+        self.truncated += 1
+        logging.info(f"Reasoning stopped at {tokens} tokens, forcing the answer")
+        reasoning = splitter.reasoning
+        answer = self._force_answer(create, messages, reasoning, on_content, kwargs)
+        return {"role": "assistant", "content": answer, "reasoning": reasoning}
+
+    def _force_answer(self, create, messages, reasoning, on_content, kwargs):
+        extra_body = {**(kwargs.get("extra_body") or {}), "continue_final_message": True,
+                      "add_generation_prompt": False}
+        kwargs = {**kwargs, "extra_body": extra_body, "max_tokens": self.answer_max_tokens}
+        # the same rendering as the model's own output, so the prompt prefix stays cached
+        prefix = {"role": "assistant", "content": f"<think>{reasoning.rstrip()}\n</think>\n\n"}
+        aggregator = StreamAggregator()
+        for chunk in create(messages=[*messages, prefix], stream=True, **kwargs):
+            delta = aggregator.add(chunk)
+            if delta is None:
+                continue
+            # the reasoning parser can report the continuation as reasoning, it is the answer
+            text = delta.content or getattr(delta, "reasoning_content", None)
+            if text and on_content:
+                on_content("content", text)
+            if aggregator.finish_reason:
+                break
+        return aggregator.message(reasoning_as_content=True)["content"]
+
+    def histogram(self):
+        """Number of requests per reasoning length bucket, as (upper bound or None, count) pairs."""
+        counts = [0] * (len(self.buckets) + 1)
+        for tokens in self.reasoning_tokens:
+            counts[bisect.bisect_left(self.buckets, tokens)] += 1
+        return list(zip([*self.buckets, None], counts))
+
+    def report(self):
+        total = len(self.reasoning_tokens)
+        if not total:
+            return "no requests"
+        ordered = sorted(self.reasoning_tokens)
+        lines = [f"{total} requests, {self.truncated} stopped at the budget of {self.max_reasoning_tokens} tokens, "
+                 f"reasoning tokens p50 {ordered[total // 2]}, p90 {ordered[int(total * 0.9)]}, max {ordered[-1]}"]
+        if self.time_to_first_reasoning:
+            first = sorted(self.time_to_first_reasoning)
+            lines.append(f"time to first reasoning token p50 {first[len(first) // 2]:.2f}s, max {first[-1]:.2f}s")
+        widest = max(count for _, count in self.histogram())
+        for bound, count in self.histogram():
+            label = f"<= {bound}" if bound is not None else f"> {self.buckets[-1]}"
+            lines.append(f"{label:>8} {count:>6} {'#' * round(count / widest * 40)}")
+        return "\n".join(lines)
@@ -0,0 +1,109 @@
+import time
+from collections import deque
+
+from stream_aggregator import StreamAggregator
+
+
+class DropSink:
+    """Discards the reasoning, only counts it."""
+
+    def __init__(self):
+        self.chars = 0
+
+    def append(self, text):
+        self.chars += len(text)
+
+    def __iter__(self):
+        return iter(())
+
+    def close(self):
+        pass
+
+
+class MemorySink(DropSink):
+    """Keeps all of the reasoning, for when it is bounded some other way."""
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+
+    def append(self, text):
+        self.chars += len(text)
+        self._parts.append(text)
+
+    def __iter__(self):
+        return iter(self._parts)
+
+
+class RingBufferSink(DropSink):
+    """Keeps the last `max_chars` characters of the reasoning."""
+
+    def __init__(self, max_chars=4000):
+        super().__init__()
+        self.max_chars = max_chars
+        self._parts = deque()
+        self._kept = 0
+
+    def append(self, text):
+        self.chars += len(text)
+        self._parts.append(text)
+        self._kept += len(text)
+        while self._kept - len(self._parts[0]) >= self.max_chars:
+            self._kept -= len(self._parts.popleft())
+
+    def __iter__(self):
+        text = "".join(self._parts)
+        return iter((text[-self.max_chars:],))
+
+
+class FileSink(DropSink):
+    """Writes the reasoning to the file at `path` as it arrives; nothing is kept in memory."""
+
+    def __init__(self, path, mode="a"):
+        super().__init__()
+        self._file = open(path, mode, encoding="utf-8")
+
+    def append(self, text):
+        self.chars += len(text)
+        self._file.write(text)
+
+    def close(self):
+        self._file.close()
+
+
+class ReasoningSplitter(StreamAggregator):
+    """StreamAggregator that sends reasoning to a sink and times the first tokens.
+
+    The answer is collected as usual, while the reasoning only goes to `sink`
+    (a DropSink, RingBufferSink or FileSink; by default the last 4000
+    characters are kept), so memory per conversation stays bounded however
+    long the model thinks. `reasoning` and `message()` see only what the
+    sink keeps, including the fallback that returns reasoning as content.
+
+    `time_to_first_reasoning` and `time_to_first_answer` are in seconds from
+    `started` (a time.perf_counter() value, by default the construction).
+    """
+
+    def __init__(self, sink=None, started=None, **kwargs):
+        self.sink = RingBufferSink() if sink is None else sink
+        super().__init__(reasoning_sink=self.sink, **kwargs)
+        self.started = time.perf_counter() if started is None else started
+        self.time_to_first_reasoning = None
+        self.time_to_first_answer = None
+
+    @property
+    def reasoning_chars(self):
+        return self.sink.chars
+
+    def add(self, chunk):
+        delta = super().add(chunk)
+        if delta is not None and self.time_to_first_answer is None:
+            # only until the answer starts, reasoning comes before it
+            if delta.content:
+                self.time_to_first_answer = time.perf_counter() - self.started
+            elif self.time_to_first_reasoning is None and getattr(delta, "reasoning_content", None):
+                self.time_to_first_reasoning = time.perf_counter() - self.started
+        return delta
+
+    def close(self):
+        self.sink.close()
@@ -1,12 +1,18 @@
 import logging
+import time
 from openai import OpenAI
 from termcolor import colored  
 
+from reasoning_budget import ReasoningBudget
+from reasoning_splitter import ReasoningSplitter, RingBufferSink
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 model = "Bielik-11B-v2.5-Instruct" # Replace with your desired model
 client = OpenAI(api_key="EMPTY", base_url="http://127.0.0.1:8000/v1") # Adjust if needed
 logging.info(f"Using model: {model}")
+# Thinking requests have no max_tokens; stop runaway reasoning and make the model answer
+reasoning_budget = ReasoningBudget(max_reasoning_tokens=2048)
 
 role_to_color = {
     "system": "red",
@@ -42,86 +48,107 @@ def pretty_print_conversation(messages):
         
         print() # Add a newline after each message for separation
 
-def chat_completion_request(messages, enable_thinking):
+def chat_completion_request(messages):
     try:
-        if enable_thinking:
-            response_stream = client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=1.0, # the high temperature to generate more creative and varied reasoning paths
-                stream=True,
-                extra_body={"chat_template_kwargs": {"enable_thinking": enable_thinking}}
-            )
-        else:
-            response_stream = client.chat.completions.create(
-                model=model,
-                messages=messages,
-                max_tokens=2000, # prevent long outputs
-                temperature=0.2,
-                stream=True
-            )
+        response_stream = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=2000, # prevent long outputs
+            temperature=0.2,
+            stream=True
+        )
         return response_stream
     except Exception as e:
         logging.warning(f"Unable to generate ChatCompletion response. Exception: {e}")
         return e
 
-def process_streamed_response(stream, print_stream=False):
-    full_response_content = ""
-    full_reasoning_content = ""
+def thinking_completion(messages):
+    reasoning_color = role_to_color.get("reasoning", "white")
+    last_kind = None
+
+    def print_stream(kind, text):
+        nonlocal last_kind
+        if kind == "reasoning" and last_kind != "reasoning":
+            print(colored("[ Thinking... ]\n", reasoning_color), end="", flush=True)
+        elif kind == "content" and last_kind == "reasoning":
+            print(colored("\n[ Thinking finished ]\n", reasoning_color), end="", flush=True)
+        print(colored(text, role_to_color.get("assistant" if kind == "content" else kind)), end="", flush=True)
+        last_kind = kind
+
+    try:
+        assistant_message_dict = reasoning_budget.complete(
+            client.chat.completions.create,
+            messages,
+            on_content=print_stream,
+            model=model,
+            temperature=1.0, # the high temperature to generate more creative and varied reasoning paths
+            extra_body={"chat_template_kwargs": {"enable_thinking": True}}
+        )
+    except Exception as e:
+        logging.warning(f"Unable to generate ChatCompletion response. Exception: {e}")
+        return e
+    print()
+    return assistant_message_dict
+
+def process_streamed_response(stream, print_stream=False, started=None):
+    # Keeps the answer and only the last 4000 characters of the reasoning, however long it is
+    aggregator = ReasoningSplitter(RingBufferSink(max_chars=4000), started=started)
     reasoning = False
     assistant_color = role_to_color.get("assistant", "white")
     reasoning_color = role_to_color.get("reasoning", "white")
 
     for chunk in stream:
-        delta = chunk.choices[0].delta
-        finish_reason = chunk.choices[0].finish_reason
+        delta = aggregator.add(chunk)
+        if delta is None:
+            continue
 
-        if hasattr(delta, "reasoning_content") and delta.reasoning_content:
-            full_reasoning_content += delta.reasoning_content
-            if print_stream:
+        if print_stream:
+            if getattr(delta, "reasoning_content", None):
                 if not reasoning:
                     print(colored("[ Thinking... ]\n", reasoning_color), end="", flush=True)
                 print(colored(delta.reasoning_content, reasoning_color), end="", flush=True)
-            reasoning = True
-        elif hasattr(delta, "content") and delta.content:
-            full_response_content += delta.content
-            if print_stream:
+                reasoning = True
+            elif delta.content:
                 if reasoning:
                     print(colored("[ Thinking finished ]\n", reasoning_color), end="", flush=True)
                     reasoning = False
                 print(colored(delta.content, assistant_color), end="", flush=True)
         
-        if finish_reason:
+        if aggregator.finish_reason:
             break # Exit loop once a finish reason is received
 
-    if full_reasoning_content and not full_response_content:
-        # workaround to handle cases where only reasoning is provided
-        full_response_content = full_reasoning_content
-        full_reasoning_content = ""
-        if print_stream:
+    assistant_message_dict = aggregator.message()
+    assistant_message_dict.setdefault("reasoning", None)
+    if aggregator.time_to_first_reasoning is not None:
+        logging.info(f"Time to first reasoning token: {aggregator.time_to_first_reasoning:.2f}s, "
+                     f"{aggregator.reasoning_chars} characters of reasoning")
+    if aggregator.time_to_first_answer is not None:
+        logging.info(f"Time to first answer token: {aggregator.time_to_first_answer:.2f}s")
+
+    if print_stream:
+        if aggregator.reasoning and not aggregator.content:
+            # only reasoning was provided, it is shown as the answer
             if reasoning:
                 print(colored("\n[ Thinking finished ]\n", reasoning_color), end="", flush=True)
-                reasoning = False
-            print(colored(full_response_content, assistant_color), end="", flush=True)
-    
-    if print_stream:
+            print(colored(assistant_message_dict["content"], assistant_color), end="", flush=True)
         print()
 
-    assistant_message_dict = {"role": "assistant", "content": None, "reasoning": None}
-    
-    if full_reasoning_content:
-        assistant_message_dict["reasoning"] = full_reasoning_content
-    if full_response_content:
-        assistant_message_dict["content"] = full_response_content
-    else:
-        assistant_message_dict["content"] = "" 
-
     return assistant_message_dict
 
 def add_turn(prompt, messages, enable_thinking=False):
     messages.append({"role": "user", "content": prompt})
 
-    stream = chat_completion_request(messages, enable_thinking)
+    if enable_thinking:
+        print(colored(f"assistant: ", role_to_color.get("assistant")), end="", flush=True)
+        assistant_response_dict = thinking_completion(messages)
+        if isinstance(assistant_response_dict, Exception):
+            messages.append({"role": "assistant", "content": f"API Error: Could not get response. {assistant_response_dict}"})
+            return
+        messages.append(assistant_response_dict)
+        return
+
+    started = time.perf_counter()
+    stream = chat_completion_request(messages)
     if isinstance(stream, Exception):
         logging.error(f"Error in first API call: {stream}")
         # Add an error message to conversation history for the assistant's turn
@@ -130,7 +157,7 @@ def add_turn(prompt, messages, enable_thinking=False):
         return
 
     print(colored(f"assistant: ", role_to_color.get("assistant")), end="", flush=True)
-    assistant_response_dict = process_streamed_response(stream, print_stream=True)
+    assistant_response_dict = process_streamed_response(stream, print_stream=True, started=started)
     messages.append(assistant_response_dict)
 
 
@@ -153,3 +180,4 @@ if __name__ == "__main__":
     
     logging.info(f"--- Final Conversation History ---")
     pretty_print_conversation(messages)
+    logging.info(f"Reasoning lengths:\n{reasoning_budget.report()}")
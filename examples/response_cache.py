@@ -0,0 +1,129 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+
+def request_key(**kwargs):
+    """Hash of a chat completion request: model, messages, tools, extra_body and the other arguments."""
+    text = json.dumps(kwargs, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class _MemoryStore:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (stored_at, payload), least recently used first
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, stored_at, payload):
+        self._entries[key] = (stored_at, payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+
+
+class _SQLiteStore:
+    def __init__(self, path, max_entries):
+        self.max_entries = max_entries
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA mmap_size=268435456")  # read entries through a memory map
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses "
+                         "(key TEXT PRIMARY KEY, stored_at REAL, used_at REAL, payload TEXT)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+
+    def get(self, key):
+        row = self._db.execute("SELECT stored_at, payload FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._db.execute("UPDATE responses SET used_at = ? WHERE key = ?", (time.time(), key))
+        return row
+
+    def put(self, key, stored_at, payload):
+        self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)", (key, stored_at, stored_at, payload))
+        self._db.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY used_at DESC "
+                         "LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def delete(self, key):
+        self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+
+class ResponseCache:
+    """Opt-in cache of chat completions for pipelines that send the same requests again.
+
+    Responses are kept in memory, or in the SQLite file `path` so they survive
+    restarts, with at most `max_entries` least recently used entries, each
+    for at most `ttl` seconds. Streamed responses are stored chunk by chunk
+    and replayed as ChatCompletionChunk objects, so streaming callers work
+    unchanged. Only complete responses (with a finish_reason) are stored.
+
+    A cached answer is returned even for requests that sample with
+    temperature > 0, which is the point for repeated pipeline runs.
+    """
+
+    def __init__(self, path=None, max_entries=1024, ttl=None):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._store = _SQLiteStore(path, max_entries) if path else _MemoryStore(max_entries)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._store.get(key)
+            if entry is not None and self.ttl is not None and time.time() - entry[0] > self.ttl:
+                self._store.delete(key)
+                entry = None
+        return None if entry is None else json.loads(entry[1])
+
+    def put(self, key, value):
+        payload = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._store.put(key, time.time(), payload)
+
+    def create(self, create, **kwargs):
+        """Call `create` (e.g. `client.chat.completions.create`) with `kwargs`, or replay its cached response."""
+        key = request_key(**kwargs)
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            if kwargs.get("stream"):
+                return (ChatCompletionChunk.model_validate(chunk) for chunk in cached)
+            return ChatCompletion.model_validate(cached)
+
+        self.misses += 1
+        response = create(**kwargs)
+        if kwargs.get("stream"):
+            return self._record(key, response)
+        if response.choices and response.choices[0].finish_reason:
+            self.put(key, response.model_dump(mode="json"))
+        return response
+
+    def _record(self, key, stream):
+        chunks = []
+        finished = False
+        try:
+            for chunk in stream:
+                chunks.append(chunk.model_dump(mode="json"))
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    finished = True
+                yield chunk
+        finally:
+            # the examples stop reading at finish_reason, which closes this generator
+            if finished:
+                self.put(key, chunks)
+            else:
+                logging.debug(f"Streamed response {key[:12]} ended without finish_reason, not cached")
@@ -0,0 +1,124 @@
+import logging
+
+
+class ToolCallRecord:
+    """What has been streamed of one tool call; the parts are joined on demand."""
+
+    __slots__ = ("index", "id", "type", "_name", "_arguments")
+
+    def __init__(self, index):
+        self.index = index
+        self.id = None
+        self.type = "function"
+        self._name = []
+        self._arguments = []
+
+    def add(self, tool_call_chunk):
+        if tool_call_chunk.id:
+            self.id = tool_call_chunk.id
+        if tool_call_chunk.type:
+            self.type = tool_call_chunk.type
+        function = tool_call_chunk.function
+        if function:
+            if function.name:
+                self._name.append(function.name)
+            if function.arguments:
+                self._arguments.append(function.arguments)
+
+    @property
+    def name(self):
+        return "".join(self._name)
+
+    @property
+    def arguments(self):
+        return "".join(self._arguments)
+
+    def to_dict(self):
+        return {"id": self.id, "type": self.type, "function": {"name": self.name, "arguments": self.arguments}}
+
+
+class StreamAggregator:
+    """Collects the deltas of a streamed chat completion into the assistant message.
+
+    Content, reasoning and tool call arguments are kept as lists of the
+    streamed parts and joined once in `message()`, so long answers cost
+    linear time; tool calls are kept in a list by their index. Reasoning goes
+    to `reasoning_sink` instead when one is given (see reasoning_splitter.py).
+    """
+
+    def __init__(self, record_type=ToolCallRecord, reasoning_sink=None):
+        self.record_type = record_type
+        self.finish_reason = None
+        self._content = []
+        self._reasoning = [] if reasoning_sink is None else reasoning_sink
+        self._tool_calls = []  # ToolCallRecord by index, None for indexes not seen
+
+    def add(self, chunk):
+        """Add one chunk of the stream and return its delta (None for chunks without choices)."""
+        if not chunk.choices:
+            return None
+        choice = chunk.choices[0]
+        delta = choice.delta
+        if choice.finish_reason:
+            self.finish_reason = choice.finish_reason
+        reasoning = getattr(delta, "reasoning_content", None)
+        if reasoning:
+            self._reasoning.append(reasoning)
+        if delta.content:
+            self._content.append(delta.content)
+        if delta.tool_calls:
+            for tool_call_chunk in delta.tool_calls:
+                self.tool_call(tool_call_chunk.index).add(tool_call_chunk)
+        return delta
+
+    def tool_call(self, index):
+        """The record of the tool call at `index`, created when first seen."""
+        tool_calls = self._tool_calls
+        if index >= len(tool_calls):
+            tool_calls.extend([None] * (index + 1 - len(tool_calls)))
+        record = tool_calls[index]
+        if record is None:
+            record = tool_calls[index] = self.record_type(index)
+        return record
+
+    @property
+    def tool_calls(self):
+        return [record for record in self._tool_calls if record is not None]
+
+    @property
+    def content(self):
+        return "".join(self._content)
+
+    @property
+    def reasoning(self):
+        return "".join(self._reasoning)
+
+    def message(self, reasoning_as_content=True):
+        """The assistant message dict, as the examples add it to the conversation.
+
+        With `reasoning_as_content`, a response that is only reasoning is
+        returned as content.
+        """
+        content = self.content
+        reasoning = self.reasoning
+        tool_calls = []
+        for record in self.tool_calls:
+            if record.id and record._name:  # basic validation
+                tool_calls.append(record.to_dict())
+            else:
+                logging.warning(f"Incomplete tool call data aggregated at index {record.index}: {record.to_dict()}")
+        if reasoning_as_content and reasoning and not content and not tool_calls:
+            # workaround to handle cases where only reasoning is provided
+            content, reasoning = reasoning, ""
+
+        assistant_message = {"role": "assistant", "content": None}
+        if reasoning:
+            assistant_message["reasoning"] = reasoning
+        if tool_calls:
+            assistant_message["tool_calls"] = tool_calls
+        # content can coexist with tool_calls or be standalone
+        if content:
+            assistant_message["content"] = content
+        elif not tool_calls:
+            assistant_message["content"] = ""
+        return assistant_message
@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from async_client import create_client
+
+
+def parse_response(output_model, content):
+    """Validate one response in a worker process; returns the model as JSON-compatible data."""
+    return output_model.model_validate_json(content).model_dump(mode="json")
+
+
+class StructuredBatchRunner:
+    """Runs many extraction prompts against one Pydantic schema.
+
+    The JSON schema and the `guided_json` request body are built once for the
+    whole batch. `concurrency` workers take prompts from a bounded queue, so
+    prompts are read only as fast as the server answers them, and responses
+    are validated in a process pool and written to the output JSONL as they
+    finish (in completion order, each line has the prompt's `index`).
+    """
+
+    def __init__(self, output_model, model="Bielik-11B-v2.5-Instruct", base_url="http://127.0.0.1:8000/v1",
+                 api_key="EMPTY", concurrency=64, parse_workers=4, system_prompt=None, **request_kwargs):
+        self.output_model = output_model
+        self.model = model
+        self.client = create_client(base_url, api_key, max_connections=concurrency)
+        self.concurrency = concurrency
+        self.parse_workers = parse_workers
+        self.system_prompt = system_prompt
+        self.request_kwargs = {"temperature": 0.0, **request_kwargs}
+        # keep the caller's own extra_body keys (guided_decoding_backend, top_k, ...)
+        self.request_kwargs["extra_body"] = {**(request_kwargs.get("extra_body") or {}),
+                                             "guided_json": output_model.model_json_schema()}
+        self.completed = 0
+        self.failed = 0
+        self.completion_tokens = 0
+
+    async def run(self, prompts, output):
+        """Process the prompts (any iterable) and write one JSON line per prompt to the open file `output`."""
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=self.parse_workers) as parse_pool:
+            workers = [asyncio.create_task(self._worker(queue, parse_pool, loop, output))
+                       for _ in range(self.concurrency)]
+            for index, prompt in enumerate(prompts):
+                await queue.put((index, prompt))  # waits while the workers are busy
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        elapsed = time.perf_counter() - started
+        total = self.completed + self.failed
+        logging.info(f"{total} prompts in {elapsed:.1f}s ({total / elapsed:.1f} prompts/s, "
+                     f"{self.completion_tokens / elapsed:.0f} tokens/s), {self.failed} failed")
+
+    async def _worker(self, queue, parse_pool, loop, output):
+        while (item := await queue.get()) is not None:
+            index, prompt = item
+            record = {"index": index, "prompt": prompt}
+            try:
+                content = await self._complete(prompt)
+                record["result"] = await loop.run_in_executor(parse_pool, parse_response, self.output_model, content)
+                self.completed += 1
+            except Exception as e:
+                record["error"] = repr(e)
+                self.failed += 1
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    async def _complete(self, prompt):
+        messages = [{"role": "user", "content": prompt}]
+        if self.system_prompt:
+            messages.insert(0, {"role": "system", "content": self.system_prompt})
+        response = await self.client.chat.completions.create(model=self.model, messages=messages,
+                                                             **self.request_kwargs)
+        if response.usage:
+            self.completion_tokens += response.usage.completion_tokens
+        return response.choices[0].message.content
+
+    async def aclose(self):
+        await self.client.close()
+
+
+def read_prompts(path):
+    """Prompts from a text file, one per line, or from JSONL lines with a "prompt" field."""
+    with open(path, encoding="utf-8") as prompt_file:
+        for line in prompt_file:
+            line = line.strip()
+            if line:
+                yield json.loads(line)["prompt"] if line.startswith("{") else line
+
+
+async def main():
+    from car_models import CarDescription
+
+    parser = argparse.ArgumentParser(description="Extract CarDescription objects for many prompts at once.")
+    parser.add_argument("input", help="prompts, one per line, or JSONL with a \"prompt\" field")
+    parser.add_argument("output", help="JSONL file for the results")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000/v1")
+    parser.add_argument("--model", default="Bielik-11B-v2.5-Instruct")
+    parser.add_argument("--concurrency", type=int, default=64, help="requests in flight at the same time")
+    parser.add_argument("--parse-workers", type=int, default=4, help="processes validating the responses")
+    args = parser.parse_args()
+
+    runner = StructuredBatchRunner(CarDescription, args.model, args.base_url, concurrency=args.concurrency,
+                                   parse_workers=args.parse_workers, max_tokens=200)
+    try:
+        with open(args.output, "w", encoding="utf-8") as output:
+            await runner.run(read_prompts(args.input), output)
+    finally:
+        await runner.aclose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    asyncio.run(main())
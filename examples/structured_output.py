@@ -1,28 +1,21 @@
 import logging
-from enum import Enum
+import os
+from functools import partial
 from openai import OpenAI
-from pydantic import BaseModel
 from termcolor import colored  
 
+from car_models import CarDescription
+from response_cache import ResponseCache
+from structured_stream import StructuredStreamParser
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 model = "Bielik-11B-v2.5-Instruct" # Replace with your desired model
 client = OpenAI(api_key="EMPTY", base_url="http://127.0.0.1:8000/v1") # Adjust if needed
+# Set BIELIK_RESPONSE_CACHE to a SQLite file to reuse the answers to repeated requests
+response_cache = ResponseCache(os.environ["BIELIK_RESPONSE_CACHE"], ttl=7 * 24 * 3600) if os.environ.get("BIELIK_RESPONSE_CACHE") else None
 logging.info(f"Using model: {model}")
 
-class CarType(str, Enum):
-    sedan = "sedan"
-    suv = "SUV"
-    truck = "Truck"
-    coupe = "Coupe"
-
-
-class CarDescription(BaseModel):
-    brand: str
-    model: str
-    car_type: CarType
-
-
 logging.info(f"Using model: {model}")
 
 def pretty_print_conversation(messages):
@@ -43,13 +36,17 @@ def pretty_print_conversation(messages):
         else:
             print(colored(str(message), base_color))
 
-def chat_completion_request(messages, extra_body):
+def chat_completion_request(messages, extra_body, stream=False):
     try:
-        response = client.chat.completions.create(
+        create = client.chat.completions.create
+        if response_cache:
+            create = partial(response_cache.create, create)
+        response = create(
             model=model,
             messages=messages,
             temperature=0.2,
             extra_body=extra_body,
+            stream=stream,
         )
         return response
     except Exception as e:
@@ -62,6 +59,19 @@ def add_turn(prompt, messages, extra_body=None):
     assistant_message = chat_response.choices[0].message
     messages.append(assistant_message.model_dump())
 
+def add_structured_turn(prompt, messages, output_model, on_field=None):
+    """Streams a guided_json answer; every field is validated as soon as it is complete and passed to `on_field(name, value)`."""
+    messages.append({"role": "user", "content": prompt})
+    stream = chat_completion_request(messages, {"guided_json": output_model.model_json_schema()}, stream=True)
+    parser = StructuredStreamParser(output_model, on_field=on_field)
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            parser.feed(chunk.choices[0].delta.content)
+    for name, error in parser.errors.items():
+        logging.warning(f"Invalid value of {name}: {error}")
+    messages.append({"role": "assistant", "content": parser.text})
+    return parser.result()
+
 if __name__ == "__main__":
     json_schema = CarDescription.model_json_schema()
     logging.info(f"Configured JSON schema: {json_schema}")
@@ -70,7 +80,9 @@ if __name__ == "__main__":
     add_turn("Wymyśl i napisz mi krótkie motywujące zdanie na dziś", messages)
     add_turn("Wygeneruj JSON zawierający markę, model i typ nadwozia najbardziej ikonicznego samochodu z lat 90.", messages, {"guided_json": json_schema})
     add_turn("Napisz teraz krótki motywujący tekst biorąc pod uwagę ten samochód", messages)
-    add_turn("Jaki jest najlepszy samochód dla 4 osobowej rodziny w Polsce? Odpowiedz w formacie JSON podając markę, model i typ nadwozia", messages, {"guided_json": json_schema})
+    car = add_structured_turn("Jaki jest najlepszy samochód dla 4 osobowej rodziny w Polsce? Odpowiedz w formacie JSON podając markę, model i typ nadwozia", messages, CarDescription,
+                              on_field=lambda name, value: logging.info(f"{name} = {value!r}"))
+    logging.info(f"Parsed: {car!r}")
       
     logging.info(f"Messages:")
     pretty_print_conversation(messages)
@@ -0,0 +1,221 @@
+import functools
+import json
+import re
+import typing
+
+# a string, cut off at the end of the text or not, or a character the scanner acts on;
+# group 1 is the closing quote, or a backslash or nothing where the text ends inside the string
+_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*("|\\?\Z)|[{}\[\],:\\]')
+# the rest of a string the previous text ended inside of
+_STRING_REST = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*("|\\?\Z)')
+
+_field_validators = {}  # output model -> ({field name: validate(json text)}, build(fields))
+_model_decoders = {}  # output model -> validate(json text)
+
+
+def _validators(output_model):
+    """JSON validators of the single fields of a Pydantic model or msgspec Struct, built once per model.
+
+    Also returns `build(fields)`, which makes the model from the validated
+    field values with the model's own validation of Python objects, so
+    validators, aliases and defaults apply without parsing the JSON again.
+    """
+    validators = _field_validators.get(output_model)
+    if validators is None:
+        if hasattr(output_model, "model_fields"):
+            from pydantic import TypeAdapter
+            # keyed like the JSON, with the constraints of the field but not its alias or default
+            validators = {(field.validation_alias if isinstance(field.validation_alias, str) else field.alias or name):
+                          TypeAdapter(typing.Annotated[(field.annotation, *field.metadata)]
+                                      if field.metadata else field.annotation).validate_json
+                          for name, field in output_model.model_fields.items()}
+            build = output_model.model_validate
+        else:
+            import msgspec
+            info = msgspec.inspect.type_info(output_model)
+            validators = {field.encode_name: msgspec.json.Decoder(type=hints).decode
+                          for field, hints in zip(info.fields, typing.get_type_hints(output_model).values())}
+            build = functools.partial(msgspec.convert, type=output_model)
+        validators = _field_validators[output_model] = validators, build
+    return validators
+
+
+def _decode_key(text):
+    return text[1:-1] if "\\" not in text else json.loads(text)
+
+
+def validate_json(output_model, text):
+    """`text` validated into a Pydantic model or msgspec Struct in one pass, without `json.loads` first."""
+    decode = _model_decoders.get(output_model)
+    if decode is None:
+        if hasattr(output_model, "model_validate_json"):
+            decode = output_model.model_validate_json
+        else:
+            import msgspec
+            decode = msgspec.json.Decoder(type=output_model).decode
+        _model_decoders[output_model] = decode
+    return decode(text)
+
+
+class StructuredStreamParser:
+    """Validates a streamed `guided_json` answer while it arrives.
+
+    Feed it the content deltas. Every top-level field of the JSON object is
+    decoded and validated against its annotation in `output_model` (a
+    Pydantic model or a msgspec Struct) in the delta that completes its
+    value. It is then in `fields` and passed to `on_field(name, value)`, so
+    consumers can start on `brand` before the rest of the object has been
+    generated. `result()` makes the model from those values with
+    `model_validate` (or `msgspec.convert`) instead of parsing the JSON again;
+    answers that are not a complete, valid object go through `validate_json`
+    for the model's own error.
+
+    Each delta is scanned once, from where the previous one stopped, and
+    only the text of the member being streamed is kept.
+    """
+
+    def __init__(self, output_model, on_field=None):
+        self.output_model = output_model
+        self.on_field = on_field
+        self.fields = {}
+        self.errors = {}  # field name -> validation error of its early value
+        self.closed = False  # the top-level object is complete
+        self.malformed = False  # not a JSON object, scanning stopped
+        self._validators, self._build = _validators(output_model)
+        self._parts = []
+        self._scanned = 0  # deltas in _parts scanned so far
+        self._depth = 0
+        self._in_string = False
+        self._escape = False  # the text ended after a backslash in a string
+        self._key_parts = None  # raw text of the top-level key being streamed
+        self._key = None
+        self._value_parts = None  # raw text of the top-level value being streamed
+        self._expect_member = False  # after a comma
+
+    def feed(self, delta):
+        """Add a content delta."""
+        self._parts.append(delta)
+        # a member can only end in a delta with a `,` or `}`; the deltas
+        # before it are scanned together with it, each character once
+        if "," in delta or "}" in delta:
+            self._scan_pending()
+
+    def _scan_pending(self):
+        parts = self._parts
+        if self._scanned == len(parts):
+            return
+        text = parts[-1] if self._scanned == len(parts) - 1 else "".join(parts[self._scanned:])
+        self._scanned = len(parts)
+        if not self.malformed:
+            self._scan(text)
+
+    def _scan(self, text):
+        if self.closed:
+            if not text.isspace():
+                self.malformed = True  # text after the object
+            return
+        depth, key, key_parts, value_parts = self._depth, self._key, self._key_parts, self._value_parts
+        # where the key or value text being streamed starts in this text, -1 if none is
+        key_from = 0 if key_parts is not None else -1
+        value_from = 0 if value_parts is not None else -1
+        pos = 0
+        if self._in_string:
+            match = _STRING_REST.match(text, 1 if self._escape else 0)
+            if match.group(1) != '"':
+                self._escape = match.group(1) == "\\"
+                (key_parts if key_from >= 0 else value_parts).append(text)
+                return
+            self._in_string = self._escape = False
+            pos = match.end()
+            if key_from >= 0:
+                key_parts.append(text[:pos])
+                key = _decode_key("".join(key_parts))
+                key_parts, key_from = None, -1
+        last = pos  # end of the previous token
+        for match in _TOKEN.finditer(text, pos):
+            i = match.start()
+            if value_from < 0 and depth < 2 and last < i and not text[last:i].isspace():
+                self.malformed = True  # text between the keys, colons and commas
+                return
+            last = match.end()
+            char = text[i]
+            if char == '"':
+                closed = match.group(1) == '"'
+                if depth == 1 and value_from < 0:
+                    if key is not None:
+                        self.malformed = True  # a second string before the colon
+                        return
+                    if closed:
+                        key = _decode_key(match.group())
+                    else:
+                        key_parts, key_from = [], i
+                if not closed:
+                    # cut off at the end of the text
+                    self._in_string, self._escape = True, match.group(1) == "\\"
+                    break
+            elif char == "{" or char == "[":
+                if depth == 0 and char == "[":
+                    self.malformed = True
+                    return
+                depth += 1
+            elif char == ":":
+                if depth == 1:
+                    if key is None or value_from >= 0:
+                        self.malformed = True
+                        return
+                    value_parts, value_from = [], last
+            elif depth == 1 and (char == "," or char == "}"):
+                # the end of a member
+                if value_from >= 0:
+                    value_parts.append(text[value_from:i])
+                    self._complete(key, "".join(value_parts))
+                    key, value_parts, value_from = None, None, -1
+                elif char == "," or key is not None or self._expect_member:
+                    self.malformed = True  # no member before the comma or brace
+                    return
+                self._expect_member = char == ","
+                if char == "}":
+                    self._depth, self._key = 0, None
+                    self.closed = True
+                    if last < len(text) and not text[last:].isspace():
+                        self.malformed = True
+                    return
+            elif char == "}" or char == "]":
+                depth -= 1
+                if depth < 1:
+                    self.malformed = True
+                    return
+            elif char == "\\":
+                self.malformed = True  # a backslash outside a string
+                return
+        else:
+            if value_from < 0 and depth < 2 and last < len(text) and not text[last:].isspace():
+                self.malformed = True
+                return
+        if key_from >= 0:
+            key_parts.append(text[key_from:])
+        if value_from >= 0:
+            value_parts.append(text[value_from:])
+        self._depth, self._key, self._key_parts, self._value_parts = depth, key, key_parts, value_parts
+
+    @property
+    def text(self):
+        return "".join(self._parts)
+
+    def result(self):
+        """The answer validated into `output_model`; raises its validation error."""
+        self._scan_pending()
+        if self.closed and not self.malformed and not self.errors:
+            return self._build(self.fields)
+        return validate_json(self.output_model, self.text)
+
+    def _complete(self, name, value_text):
+        validate = self._validators.get(name, json.loads)
+        try:
+            value = validate(value_text)
+        except ValueError as e:
+            self.errors[name] = e
+            return
+        self.fields[name] = value
+        if self.on_field:
+            self.on_field(name, value)
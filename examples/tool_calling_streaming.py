@@ -1,12 +1,21 @@
 import json
 import logging
+import os
+from functools import partial
 from openai import OpenAI
 from termcolor import colored  
 
+from history import ConversationHistory
+from response_cache import ResponseCache
+from stream_aggregator import StreamAggregator
+from tool_executor import StreamingToolExecutor
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 model = "Bielik-11B-v2.5-Instruct" # Replace with your desired model
 client = OpenAI(api_key="EMPTY", base_url="http://127.0.0.1:8000/v1") # Adjust if needed
+# Set BIELIK_RESPONSE_CACHE to a SQLite file to replay the streams of repeated requests
+response_cache = ResponseCache(os.environ["BIELIK_RESPONSE_CACHE"], ttl=7 * 24 * 3600) if os.environ.get("BIELIK_RESPONSE_CACHE") else None
 logging.info(f"Using model: {model}")
 
 tools = [
@@ -107,7 +116,10 @@ def pretty_print_conversation(messages):
 
 def chat_completion_request(messages):
     try:
-        response_stream = client.chat.completions.create(
+        create = client.chat.completions.create
+        if response_cache:
+            create = partial(response_cache.create, create)
+        response_stream = create(
             model=model,
             messages=messages,
             max_tokens=500, # prevent long outputs
@@ -121,21 +133,19 @@ def chat_completion_request(messages):
         logging.warning(f"Unable to generate ChatCompletion response. Exception: {e}")
         return e
 
-def process_streamed_response(stream, print_stream=False):
-    full_response_content = ""
-    tool_call_deltas_aggregator = {} # Keyed by index to aggregate tool call parts
+def process_streamed_response(stream, print_stream=False, tool_executor=None):
+    aggregator = StreamAggregator() # Joins content and tool call parts once the stream is done
     
     # For managing the "[tool call in progress]" message
     tool_call_in_progress_printed = False
 
     for chunk in stream:
-        delta = chunk.choices[0].delta
-        finish_reason = chunk.choices[0].finish_reason
+        delta = aggregator.add(chunk)
+        if delta is None:
+            continue
 
-        if delta.content:
-            full_response_content += delta.content
-            if print_stream:
-                print(colored(delta.content, "blue"), end="", flush=True)
+        if delta.content and print_stream:
+            print(colored(delta.content, "blue"), end="", flush=True)
 
         if delta.tool_calls:
             if print_stream and not tool_call_in_progress_printed and not delta.content:
@@ -143,54 +153,17 @@ def process_streamed_response(stream, print_stream=False):
                 print(colored("[tool call(s) in progress...]", "yellow"), end="", flush=True)
                 tool_call_in_progress_printed = True
 
-            for tool_call_chunk in delta.tool_calls:
-                index = tool_call_chunk.index
-                if index not in tool_call_deltas_aggregator:
-                    tool_call_deltas_aggregator[index] = {
-                        "id": None, 
-                        "type": "function",
-                        "function": {"name": "", "arguments": ""}
-                    }
-
-                if tool_call_chunk.id:
-                    tool_call_deltas_aggregator[index]["id"] = tool_call_chunk.id
-                
-                if tool_call_chunk.type:
-                    tool_call_deltas_aggregator[index]["type"] = tool_call_chunk.type
-
-                if tool_call_chunk.function:
-                    if tool_call_chunk.function.name:
-                        tool_call_deltas_aggregator[index]["function"]["name"] += tool_call_chunk.function.name
-                    if tool_call_chunk.function.arguments:
-                        tool_call_deltas_aggregator[index]["function"]["arguments"] += tool_call_chunk.function.arguments
+            if tool_executor is not None:
+                # start every tool as soon as its arguments are complete
+                tool_executor.feed(delta.tool_calls)
         
-        if finish_reason:
+        if aggregator.finish_reason:
             break # Exit loop once a finish reason is received
     
     if print_stream:
         print() # Newline after streaming assistant's response or tool call indication
 
-
-    assistant_message_dict = {"role": "assistant", "content": None}
-    processed_tool_calls = []
-    if tool_call_deltas_aggregator:
-        for i in sorted(tool_call_deltas_aggregator.keys()): # Process in order of index
-            tc = tool_call_deltas_aggregator[i]
-            if tc.get("id") and tc["function"].get("name"): # Basic validation
-                 processed_tool_calls.append(tc)
-            else:
-                logging.warning(f"Incomplete tool call data aggregated at index {i}: {tc}")
-    
-    if processed_tool_calls:
-        assistant_message_dict["tool_calls"] = processed_tool_calls
-    
-    # Set content if it exists. Can coexist with tool_calls or be standalone.
-    if full_response_content:
-        assistant_message_dict["content"] = full_response_content
-    elif not processed_tool_calls: # No tool calls and no content means an empty response
-        assistant_message_dict["content"] = "" 
-
-    return assistant_message_dict
+    return aggregator.message()
 
 def call_function(name, args):
     logging.info(f"Attempting to call function: {name} with args: {args}")
@@ -223,41 +196,14 @@ def add_turn(prompt, messages):
         return
 
     print(colored(f"assistant: ", role_to_color.get("assistant")), end="", flush=True)
-    assistant_response_dict = process_streamed_response(stream1, print_stream=True)
-    messages.append(assistant_response_dict)
+    with StreamingToolExecutor(call_function) as tool_executor:
+        # tools run in a thread pool while the rest of the response is streamed
+        assistant_response_dict = process_streamed_response(stream1, print_stream=True, tool_executor=tool_executor)
+        messages.append(assistant_response_dict)
+        function_response_messages_to_append = tool_executor.results()
 
     # If the assistant's response includes tool calls
     if assistant_response_dict.get("tool_calls"):
-        tool_calls = assistant_response_dict["tool_calls"]
-        
-        function_response_messages_to_append = [] 
-
-        for tool_call in tool_calls:
-            tool_function_name = tool_call['function']['name']
-            tool_function_args_str = tool_call['function']['arguments']
-            tool_call_id = tool_call['id']
-
-            logging.info(f"Received tool call: {tool_function_name}(args_str='{tool_function_args_str}') ID: {tool_call_id}")
-            
-            try:
-                tool_function_args = json.loads(tool_function_args_str)
-            except json.JSONDecodeError as e:
-                logging.error(f"Invalid JSON arguments for {tool_function_name}: {tool_function_args_str}. Error: {e}")
-                result_content = json.dumps({"error": "Invalid JSON arguments", "details": str(e)})
-            else:
-                result_content = call_function(tool_function_name, tool_function_args)
-                if result_content is None: # Function not found or returned None
-                    logging.warning(f"Function {tool_function_name} did not return a valid result (returned None).")
-                    result_content = json.dumps({"error": f"Function {tool_function_name} not found or did not return data."})
-            
-            tool_response_message = {
-                "role": "tool",
-                "tool_call_id": tool_call_id,
-                "name": tool_function_name,
-                "content": result_content, 
-            }
-            function_response_messages_to_append.append(tool_response_message)
-
         # Add all tool responses to messages history and print them
         for msg in function_response_messages_to_append:
             messages.append(msg)
@@ -276,7 +222,7 @@ def add_turn(prompt, messages):
         messages.append(final_assistant_response_dict)
 
 if __name__ == "__main__":
-    messages = []
+    messages = ConversationHistory(budget=4000) # Compacts old tool results once the history grows past the budget
     # Optional: Add a system prompt
     # messages.append({"role": "system", "content": "You are a helpful assistant with access to weather tools. Please provide answers based on tool outputs when relevant."})
 
@@ -0,0 +1,195 @@
+import json
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from stream_aggregator import StreamAggregator, ToolCallRecord
+
+
+class StreamingToolExecutor:
+    """Runs the tool calls of a streamed chat completion while the stream is still generating.
+
+    Feed it `delta.tool_calls` of every chunk. A tool call is started in the
+    thread pool as soon as its arguments are complete: when the JSON object of
+    its arguments closes, when the model moves on to the next tool call, or at
+    the latest when the stream ends. `results()` then waits for the tools and
+    returns the tool messages in the order of the calls, so a turn with several
+    tool calls takes about as long as its slowest tool.
+
+    `call_function(name, args)` returns the tool result as a string, or None
+    when there is no such tool.
+    """
+
+    def __init__(self, call_function, max_workers=8, executor=None):
+        self.call_function = call_function
+        self._executor = executor or ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        self._owns_executor = executor is None
+        self._calls = StreamAggregator(record_type=_PendingToolCall)
+        self._last_index = None
+
+    def feed(self, tool_call_deltas):
+        for tool_call_chunk in tool_call_deltas or ():
+            index = tool_call_chunk.index
+            if self._last_index is not None and index != self._last_index:
+                # the model has moved on, so the previous call cannot grow any more
+                self._start(self._calls.tool_call(self._last_index), final=True)
+            self._last_index = index
+
+            call = self._calls.tool_call(index)
+            call.add(tool_call_chunk)
+            if call.arguments_closed:
+                self._start(call)
+
+    def finish(self):
+        """Start whatever is still waiting; call once the stream has ended."""
+        for call in self._calls.tool_calls:
+            self._start(call, final=True)
+
+    def futures(self):
+        """Start whatever is still waiting and return the futures of every started tool, in call order.
+
+        Async callers await them (`asyncio.wrap_future`) before `results()`, so
+        no thread is blocked while the tools run.
+        """
+        self.finish()
+        return [call.future for call in self._calls.tool_calls if call.future is not None]
+
+    def results(self):
+        """Wait for every tool and return their tool messages, in call order."""
+        self.finish()
+        messages = []
+        for call in self._calls.tool_calls:
+            if call.future is None:
+                continue
+            messages.append({
+                "role": "tool",
+                "tool_call_id": call.id,
+                "name": call.name,
+                "content": call.future.result(),
+            })
+        return messages
+
+    def shutdown(self):
+        if self._owns_executor:
+            self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def _start(self, call, final=False):
+        if call is None or call.future is not None:
+            return
+        if not call.id or not call.name:
+            if final:
+                logging.warning(f"Incomplete tool call data: id={call.id} name={call.name!r}")
+            return
+        try:
+            args = json.loads(call.arguments)
+        except json.JSONDecodeError as e:
+            if not final:
+                return  # more arguments may still arrive
+            logging.error(f"Invalid JSON arguments for {call.name}: {call.arguments}. Error: {e}")
+            call.future = _done(json.dumps({"error": "Invalid JSON arguments", "details": str(e)}))
+            return
+        if call.errors:
+            logging.error(f"Arguments of {call.name} do not match its schema: {call.errors}")
+            call.future = _done(json.dumps({"error": "Invalid arguments", "details": call.errors}))
+            return
+        logging.info(f"Starting tool call: {call.name}(args={call.arguments}) ID: {call.id}")
+        call.future = self._executor.submit(self._run, call.name, args)
+
+    def _run(self, name, args):
+        try:
+            result = self.call_function(name, args)
+        except Exception as e:
+            logging.exception(f"Function {name} failed")
+            return json.dumps({"error": f"Function {name} failed", "details": str(e)})
+        if result is None:
+            logging.warning(f"Function {name} did not return a valid result (returned None).")
+            return json.dumps({"error": f"Function {name} not found or did not return data."})
+        return result
+
+
+class _PendingToolCall(ToolCallRecord):
+    __slots__ = ("errors", "future", "_depth", "_in_string", "_escape", "_started")
+
+    def __init__(self, index):
+        super().__init__(index)
+        self.errors = []
+        self.future = None
+        # brace tracking over the argument text, so completion is noticed
+        # without parsing the arguments again on every chunk
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._started = False
+
+    @property
+    def arguments_closed(self):
+        return self._started and self._depth == 0
+
+    def add(self, tool_call_chunk):
+        super().add(tool_call_chunk)
+        errors = getattr(tool_call_chunk, "argument_errors", None)  # sent by the parser in validation mode
+        if errors:
+            self.errors.extend(errors)
+        if tool_call_chunk.function and tool_call_chunk.function.arguments:
+            self._track_braces(tool_call_chunk.function.arguments)
+
+    def _track_braces(self, text):
+        depth, in_string, escape = self._depth, self._in_string, self._escape
+        for ch in text:
+            if in_string:
+                if escape:
+                    escape = False
+                elif ch == "\\":
+                    escape = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == "{" or ch == "[":
+                depth += 1
+                self._started = True
+            elif ch == "}" or ch == "]":
+                depth -= 1
+        self._depth, self._in_string, self._escape = depth, in_string, escape
+
+
+def _done(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+if __name__ == "__main__":
+    # offline demo: three tool calls streamed one after another, each tool
+    # takes a second - they finish together instead of one after another
+    from types import SimpleNamespace
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def slow_tool(name, args):
+        time.sleep(1.0)
+        return json.dumps({"tool": name, "location": args["location"]}, ensure_ascii=False)
+
+    def delta(index, id=None, name=None, arguments=None):
+        return SimpleNamespace(index=index, id=id, type="function" if id else None,
+                               function=SimpleNamespace(name=name, arguments=arguments))
+
+    stream = []
+    for index, city in enumerate(["Kielce", "Końskie", "Radom"]):
+        stream.append([delta(index, id=f"call_{index}", name="get_current_weather")])
+        stream += [[delta(index, arguments=part)] for part in ('{"loca', 'tion": "', city, '"}')]
+
+    started = time.perf_counter()
+    with StreamingToolExecutor(slow_tool) as tool_executor:
+        for tool_call_deltas in stream:
+            time.sleep(0.2)  # the model generating the next tokens
+            tool_executor.feed(tool_call_deltas)
+        for message in tool_executor.results():
+            print(message)
+    print(f"3 tools of 1s each, stream of {0.2 * len(stream):.1f}s: done in {time.perf_counter() - started:.1f}s")
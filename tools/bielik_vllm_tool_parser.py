@@ -1,9 +1,10 @@
+import bisect
 import json
+import os
 import re
-from typing import Union, Sequence
-
-import partial_json_parser
-from partial_json_parser.core.options import Allow
+import time
+import weakref
+from typing import Any, Callable, Union, Sequence
 
 from vllm.entrypoints.openai.protocol import (ChatCompletionRequest,
                                               DeltaFunctionCall, DeltaMessage,
@@ -16,36 +17,856 @@ from vllm.transformers_utils.tokenizer import AnyTokenizer, MistralTokenizer
 from vllm.utils import random_uuid
 
 logger = init_logger(__name__)
+# one compact JSON record per streamed delta, see BielikToolParser.trace
+trace_logger = init_logger(__name__ + ".trace")
 
+# what the scanner is waiting for at the top level of the tool call object
+_EXPECT_OBJECT, _EXPECT_KEY, _EXPECT_COLON, _EXPECT_VALUE, _IN_VALUE, _IN_SCALAR, _EXPECT_COMMA = range(7)
+# what the string being scanned is
+_NESTED_STRING, _KEY_STRING, _VALUE_STRING = range(3)
 
-@ToolParserManager.register_module("bielik")
-class BielikToolParser(ToolParser):
+_STRING_SPECIAL = re.compile(r'["\\]')
+# the lexemes of a JSON document, a string cut off at the end included
+_JSON_LEXEME = re.compile(r'(?P<string>"(?:[^"\\]|\\.)*")|(?P<partial>"(?:[^"\\]|\\.)*\\?)|[{}\[\],:]|\s+|[^{}\[\],:\s"]+')
+# endings that make a cut off true/false/null whole
+_LITERAL_ENDS = ("rue", "ue", "e", "alse", "lse", "se", "ull", "ll", "l")
+_NESTED_SPECIAL = re.compile(r'[{}\[\]"]')
+# an escape sequence cut off at the end of the text; a high surrogate waits for its low half
+_ESCAPE_TAIL = re.compile(r'\\(?:u(?:[dD][89abAB][0-9a-fA-F]{2}(?:\\(?:u[0-9a-fA-F]{0,3})?)?|[0-9a-fA-F]{0,3}))?')
 
-    def __init__(self, tokenizer: AnyTokenizer):
-        super().__init__(tokenizer)
+# the layout the chat template asks for, `{"name": "...", "arguments": ...}`;
+# anything else goes through _ToolCallScanner
+_TOOL_CALL_PREFIX = re.compile(r'\s*\{\s*"name"\s*:\s*"((?:[^"\\]|\\.)*)"\s*,\s*"arguments"\s*:\s*')
 
-        if isinstance(self.model_tokenizer, MistralTokenizer):
-            logger.warning("Detected Mistral tokenizer when using a Bielik model")
-            self.model_tokenizer = self.model_tokenizer.tokenizer
 
+def _select_json_backend(backend: str) -> tuple[str, Callable[[str], Any]]:
+    """Pick the function used to decode tool call JSON.
+
+    `backend` is one of "auto", "msgspec" or "json". "auto" takes msgspec when
+    it is installed. msgspec decodes integers of any size exactly, like the
+    standard library; the documents it rejects (NaN, numbers out of the float
+    range, lone surrogates, ...) are decoded again with the standard library,
+    so both backends accept and return the same values. orjson is not offered:
+    it turns integers over 64 bits into floats instead of raising.
+    """
+    if backend in ("auto", "msgspec"):
+        try:
+            import msgspec
+        except ImportError:
+            pass
+        else:
+            fast_loads = msgspec.json.Decoder().decode
+
+            def loads(text: str) -> Any:
+                try:
+                    return fast_loads(text)
+                except msgspec.DecodeError:
+                    return json.loads(text)
+
+            return "msgspec", loads
+    if backend not in ("auto", "json"):
+        logger.warning("JSON backend %r is not available, using the standard library json module", backend)
+    return "json", json.loads
+
+
+# set BIELIK_TOOL_PARSER_JSON=msgspec|json to force a backend
+_JSON_BACKEND, _json_loads = _select_json_backend(os.environ.get("BIELIK_TOOL_PARSER_JSON", "auto"))
+
+# (<tool_call> id, </tool_call> id) per tokenizer object. vLLM builds a parser
+# for every request, and reading the vocab copies the whole dict on most
+# tokenizers, so it is only done once per tokenizer.
+_tokenizer_constants: "weakref.WeakKeyDictionary[Any, tuple[int, int]]" = weakref.WeakKeyDictionary()
+
+
+def _tool_name_prefixes(tools: Union[list, None]) -> dict[str, Union[str, None]]:
+    """Map every prefix of the request's tool names to the one name it leads to.
+
+    Prefixes shared by several names map to None. The streaming path sends a
+    tool name as soon as what the model has written of it leads to a single
+    name, instead of waiting for the closing quote.
+    """
+    prefixes: dict[str, Union[str, None]] = {}
+    for tool in tools or ():
+        function = getattr(tool, "function", None)
+        name = getattr(function, "name", None)
+        if not name:
+            continue
+        for end in range(1, len(name) + 1):
+            prefix = name[:end]
+            # a name that is the start of a longer one stays ambiguous until
+            # the closing quote
+            prefixes[prefix] = name if prefixes.get(prefix, name) == name else None
+    return prefixes
+
+
+class _ToolCallScanner:
+    """Resumable lexer for the ``{"name": ..., "arguments": ...}`` object of a single tool call.
+
+    Text is fed in as it streams and the lexer state is kept between calls, so
+    every character is looked at once. The scanner records the decoded tool
+    name, the offset where the ``"name"`` value ends and the offsets where the
+    ``"arguments"`` value starts and ends, and hands back the raw argument text
+    as it arrives. Nothing is parsed into Python objects or re-serialised.
+    """
+
+    __slots__ = ("name", "name_end", "arguments_start", "arguments_end", "done", "malformed",
+                 "_pos", "_depth", "_expect", "_key", "_in_string", "_escape", "_string_role",
+                 "_string_buf", "_scalar_end", "_value_start", "_held")
+
+    def __init__(self):
+        self.name: Union[str, None] = None
+        self.name_end: int = -1
+        self.arguments_start: int = -1
+        self.arguments_end: int = -1
+        self.done: bool = False
+        self.malformed: bool = False
+
+        self._pos = 0  # number of characters fed so far
+        self._depth = 0
+        self._expect = _EXPECT_OBJECT
+        self._key: Union[str, None] = None  # top-level key whose value is being scanned
+        self._in_string = False
+        self._escape = False
+        self._string_role = _NESTED_STRING
+        self._string_buf: Union[list[str], None] = None  # raw text of a key or of the name value
+        self._scalar_end = 0
+        self._value_start = 0  # where the top-level value being scanned starts
+        self._held = ""  # trailing whitespace or unfinished escape of the arguments not handed out yet
+
+    def feed(self, text: str) -> str:
+        """Scan the next chunk of the tool call and return the argument text it completes."""
+        base = self._pos
+        if not (self.done or self.malformed):
+            self._scan(text, base)
+        self._pos = base + len(text)
+
+        if self.malformed or self.arguments_start < 0:
+            return ""
+        if 0 <= self.arguments_end <= base:
+            return ""
+        lo = max(self.arguments_start, base) - base
+        if self.arguments_end >= 0:
+            arguments = self._held + text[lo:self.arguments_end - base]
+            self._held = ""
+            return arguments
+        # hold back trailing whitespace until we know it is inside the arguments,
+        # and an unfinished escape sequence, so that every chunk handed out
+        # ends between characters (vLLM re-encodes the chunks sent so far)
+        arguments = self._held + text[lo:]
+        keep = len(arguments.rstrip())
+        if self._in_string and keep == len(arguments):
+            keep -= _unfinished_escape(arguments)
+        self._held = arguments[keep:]
+        return arguments[:keep]
+
+    def name_prefix(self) -> Union[str, None]:
+        """The part of the name value scanned so far, while the scanner is inside it."""
+        if not (self._in_string and self._string_role == _VALUE_STRING and self._key == "name") \
+                or self._string_buf is None:
+            return None
+        raw = "".join(self._string_buf)
+        # escapes are left to the full decode at the closing quote
+        return None if "\\" in raw else raw[1:]
+
+    def _scan(self, text: str, base: int) -> None:
+        i, n = 0, len(text)
+        while i < n:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    if self._string_buf is not None:
+                        self._string_buf.append(text[i])
+                    i += 1
+                    continue
+                m = _STRING_SPECIAL.search(text, i)
+                if m is None:
+                    if self._string_buf is not None:
+                        self._string_buf.append(text[i:])
+                    return
+                j = m.end()
+                if self._string_buf is not None:
+                    self._string_buf.append(text[i:j])
+                i = j
+                if text[j - 1] == "\\":
+                    self._escape = True
+                else:
+                    self._in_string = False
+                    self._end_string(base + i)
+                    if self.malformed:
+                        return
+                continue
+
+            if self._depth > 1:
+                # inside a nested value only brackets and strings matter
+                m = _NESTED_SPECIAL.search(text, i)
+                if m is None:
+                    return
+                ch = m.group()
+                i = m.end()
+                if ch == '"':
+                    self._in_string = True
+                    self._string_role = _NESTED_STRING
+                    self._string_buf = None
+                elif ch == "{" or ch == "[":
+                    self._depth += 1
+                else:
+                    self._depth -= 1
+                    if self._depth == 1:
+                        self._end_value(base + i)
+                continue
+
+            ch = text[i]
+            i += 1
+            if ch in " \t\r\n":
+                continue
+            expect = self._expect
+            if expect == _EXPECT_KEY:
+                if ch == '"':
+                    self._start_string(_KEY_STRING, True)
+                elif ch == "}":
+                    self._close()
+                    return
+                else:
+                    self.malformed = True
+            elif expect == _EXPECT_COLON:
+                if ch == ":":
+                    self._expect = _EXPECT_VALUE
+                else:
+                    self.malformed = True
+            elif expect == _EXPECT_VALUE:
+                self._value_start = base + i - 1
+                if self._key == "arguments" and self.arguments_start < 0:
+                    self.arguments_start = self._value_start
+                if ch == '"':
+                    self._start_string(_VALUE_STRING, self._key == "name")
+                elif ch == "{" or ch == "[":
+                    self._depth = 2
+                    self._expect = _IN_VALUE
+                elif ch == "}" or ch == ",":
+                    self.malformed = True
+                else:
+                    self._expect = _IN_SCALAR
+                    self._scalar_end = base + i
+            elif expect == _IN_SCALAR:
+                if ch == "," or ch == "}":
+                    self._end_value(self._scalar_end)
+                    i -= 1  # let the comma state handle the delimiter
+                else:
+                    self._scalar_end = base + i
+            elif expect == _EXPECT_COMMA:
+                if ch == ",":
+                    self._expect = _EXPECT_KEY
+                elif ch == "}":
+                    self._close()
+                    return
+                else:
+                    self.malformed = True
+            elif expect == _EXPECT_OBJECT and ch == "{":
+                self._depth = 1
+                self._expect = _EXPECT_KEY
+            else:
+                self.malformed = True
+            if self.malformed:
+                return
+
+    def _start_string(self, role: int, buffered: bool) -> None:
+        self._in_string = True
+        self._string_role = role
+        self._string_buf = ['"'] if buffered else None
+
+    def _end_string(self, end: int) -> None:
+        if self._string_role == _NESTED_STRING:
+            return
+        raw = "".join(self._string_buf) if self._string_buf is not None else None
+        self._string_buf = None
+        if self._string_role == _KEY_STRING:
+            try:
+                self._key = json.loads(raw)
+            except ValueError:
+                self.malformed = True
+                return
+            self._expect = _EXPECT_COLON
+            return
+        if raw is not None and self.name is None:
+            try:
+                self.name = json.loads(raw)
+            except ValueError:
+                self.malformed = True
+                return
+        self._end_value(end)
+
+    def _end_value(self, end: int) -> None:
+        if self._key == "name" and self.name_end < 0:
+            self.name_end = end
+        elif self._key == "arguments" and self.arguments_end < 0:
+            self.arguments_end = end
+        self._key = None
+        self._expect = _EXPECT_COMMA
+
+    def _close(self) -> None:
+        self._depth = 0
+        self.done = True
+
+
+def _unfinished_escape(text: str) -> int:
+    """Length of the escape sequence the string `text` ends inside of, 0 if it ends between characters."""
+    if "\\" not in text[-12:]:
+        return 0
+    for start in range(max(0, len(text) - 12), len(text)):
+        if text[start] == "\\" and _ESCAPE_TAIL.fullmatch(text, start):
+            # it starts an escape if the backslashes before it pair up
+            run = start
+            while run and text[run - 1] == "\\":
+                run -= 1
+            if (start - run) % 2 == 0:
+                return len(text) - start
+    return 0
+
+
+def _dumps_prefix(text: str) -> str:
+    """Render the start of a JSON document the way json.dumps(..., ensure_ascii=False) renders the whole.
+
+    Whitespace is dropped, separators get json.dumps' spacing and strings and
+    numbers are re-encoded. A string cut off inside an escape sequence ends
+    before it, and a number at the end is left as is, it may go on.
+    """
+    parts = []
+    for match in _JSON_LEXEME.finditer(text):
+        lexeme = match.group()
+        first = lexeme[0]
+        if first in " \t\r\n":
+            continue
+        if first == ",":
+            parts.append(", ")
+        elif first == ":":
+            parts.append(": ")
+        elif first in "{}[]":
+            parts.append(lexeme)
+        elif match.lastgroup == "partial":
+            end, n = 1, len(lexeme)
+            while end < n:
+                if lexeme[end] != "\\":
+                    end += 1
+                elif end + 1 < n and (lexeme[end + 1] != "u" or end + 6 <= n):
+                    end += 6 if lexeme[end + 1] == "u" else 2
+                else:
+                    break
+            try:
+                parts.append(json.dumps(json.loads(lexeme[:end] + '"'), ensure_ascii=False)[:-1])
+            except ValueError:
+                parts.append(lexeme[:end])
+        elif match.end() == len(text) and first != '"':
+            parts.append(lexeme)
+        else:
+            try:
+                parts.append(json.dumps(json.loads(lexeme), ensure_ascii=False))
+            except ValueError:
+                parts.append(lexeme)
+    return "".join(parts)
+
+
+def _complete_json_prefix(prefix: str) -> Any:
+    """A value whose json.dumps(..., ensure_ascii=False) starts with `prefix`, a _dumps_prefix() result.
+
+    Open strings and containers are closed, and a key or value the prefix
+    stops before is filled in with null. Returns None if there is no such value.
+    """
+    closers = []
+    in_string = escape = False
+    for ch in prefix:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{" or ch == "[":
+            closers.append("}" if ch == "{" else "]")
+        elif (ch == "}" or ch == "]") and closers:
+            closers.pop()
+    head = prefix + '"' if in_string else prefix
+    tail = "".join(reversed(closers))
+    for filler in ("", "null", ": null", '"": null', "0", *_LITERAL_ENDS):
+        try:
+            value = json.loads(head + filler + tail)
+        except ValueError:
+            continue
+        if json.dumps(value, ensure_ascii=False).startswith(prefix):
+            return value
+    return None
+
+
+def _json_type(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "integer"
+    if isinstance(value, float):
+        return "integer" if value.is_integer() else "number"
+    return {str: "string", list: "array", dict: "object"}.get(type(value), type(value).__name__)
+
+
+def _json_equal(a: Any, b: Any) -> bool:
+    """`a == b` as JSON Schema compares values: true and false are not the numbers 1 and 0."""
+    if isinstance(a, bool) or isinstance(b, bool):
+        return a is b
+    if isinstance(a, list):
+        return isinstance(b, list) and len(a) == len(b) and all(map(_json_equal, a, b))
+    if isinstance(a, dict):
+        return (isinstance(b, dict) and a.keys() == b.keys()
+                and all(_json_equal(item, b[key]) for key, item in a.items()))
+    return a == b
+
+
+def _compile_schema(schema: Any) -> Callable[[Any, str, list[str]], None]:
+    """Turn a JSON Schema into a function that appends what a value violates to a list.
+
+    Covers what tool definitions use: type, enum, const, numeric and length
+    limits, pattern, items and the object keywords. Other keywords are ignored.
+    """
+    if not isinstance(schema, dict):
+        return lambda value, path, errors: None
+    checks: list[Callable[[Any, str, list[str]], None]] = []
+
+    if "type" in schema:
+        allowed = {schema["type"]} if isinstance(schema["type"], str) else set(schema["type"])
+        if "number" in allowed:
+            allowed.add("integer")
+
+        def check_type(value, path, errors):
+            if _json_type(value) not in allowed:
+                errors.append(f"{path}: expected {' or '.join(sorted(allowed))}, got {_json_type(value)}")
+        checks.append(check_type)
+    if "enum" in schema or "const" in schema:
+        options = schema["enum"] if "enum" in schema else [schema["const"]]
+
+        def check_enum(value, path, errors):
+            if not any(_json_equal(value, option) for option in options):
+                errors.append(f"{path}: {json.dumps(value, ensure_ascii=False)} is not one of "
+                              f"{json.dumps(options, ensure_ascii=False)}")
+        checks.append(check_enum)
+    limits = [(keyword, schema[keyword]) for keyword in
+              ("minimum", "maximum", "exclusiveMinimum", "exclusiveMaximum") if keyword in schema]
+    if limits:
+        def check_limits(value, path, errors):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                return
+            for keyword, limit in limits:
+                if (keyword == "minimum" and value < limit or keyword == "maximum" and value > limit
+                        or keyword == "exclusiveMinimum" and value <= limit
+                        or keyword == "exclusiveMaximum" and value >= limit):
+                    errors.append(f"{path}: {value} violates {keyword} {limit}")
+        checks.append(check_limits)
+    for keyword, kind in (("minLength", str), ("maxLength", str), ("minItems", list), ("maxItems", list)):
+        if keyword in schema:
+            def check_length(value, path, errors, keyword=keyword, kind=kind, limit=schema[keyword]):
+                if isinstance(value, kind) and (len(value) < limit if keyword.startswith("min") else len(value) > limit):
+                    errors.append(f"{path}: length {len(value)} violates {keyword} {limit}")
+            checks.append(check_length)
+    if "pattern" in schema:
+        pattern = re.compile(schema["pattern"])
+
+        def check_pattern(value, path, errors):
+            if isinstance(value, str) and not pattern.search(value):
+                errors.append(f"{path}: does not match {schema['pattern']!r}")
+        checks.append(check_pattern)
+    if isinstance(schema.get("items"), dict):
+        check_item = _compile_schema(schema["items"])
+
+        def check_items(value, path, errors):
+            if isinstance(value, list):
+                for index, item in enumerate(value):
+                    check_item(item, f"{path}[{index}]", errors)
+        checks.append(check_items)
+    if "properties" in schema or "required" in schema or "additionalProperties" in schema:
+        checks.append(_ObjectSchema(schema).check)
+
+    def check(value, path, errors):
+        for check_one in checks:
+            check_one(value, path, errors)
+    return check
+
+
+class _ObjectSchema:
+    """The object keywords of a schema, checked member by member."""
+
+    __slots__ = ("properties", "required", "additional")
+
+    def __init__(self, schema: dict):
+        self.properties = {key: _compile_schema(subschema)
+                           for key, subschema in (schema.get("properties") or {}).items()}
+        self.required: list[str] = list(schema.get("required") or ())
+        additional = schema.get("additionalProperties", True)
+        self.additional = additional if isinstance(additional, bool) else _compile_schema(additional)
+
+    def check_key(self, key: str, path: str, errors: list[str]) -> None:
+        if key not in self.properties and self.additional is False:
+            errors.append(f"{path}: unexpected property {key!r}")
+
+    def check_member(self, key: str, value: Any, path: str, errors: list[str]) -> None:
+        check = self.properties.get(key)
+        if check is None and not isinstance(self.additional, bool):
+            check = self.additional
+        if check is not None:
+            check(value, f"{path}.{key}", errors)
+
+    def check_missing(self, keys: set, path: str, errors: list[str]) -> None:
+        for key in self.required:
+            if key not in keys:
+                errors.append(f"{path}: missing required property {key!r}")
+
+    def check(self, value: Any, path: str, errors: list[str]) -> None:
+        if not isinstance(value, dict):
+            return
+        for key, member in value.items():
+            self.check_key(key, path, errors)
+            self.check_member(key, member, path, errors)
+        self.check_missing(value.keys(), path, errors)
+
+
+class _ArgumentsChecker(_ToolCallScanner):
+    """Checks the arguments of one tool call against the tool's parameters schema as they stream.
+
+    Reuses the scanner's lexer on the argument text: every top-level member is
+    decoded and checked once, when its value is complete, and unexpected keys
+    are reported as soon as they are read.
+    """
+
+    __slots__ = ("_schema", "_chunks", "_chunks_start", "_keys", "_reported", "errors")
+
+    def __init__(self, schema: _ObjectSchema):
+        super().__init__()
+        self._schema = schema
+        self._chunks: list[str] = []  # argument text from offset _chunks_start on
+        self._chunks_start = 0
+        self._keys: set[str] = set()
+        self._reported = 0
+        self.errors: list[str] = []
+
+    def check(self, text: str) -> list[str]:
+        """Scan more argument text and return the violations found in it."""
+        self._chunks.append(text)
+        malformed = self.malformed
+        self.feed(text)
+        if self.malformed and not malformed:
+            self.errors.append("arguments: not a valid JSON object")
+        new_errors = self.errors[self._reported:]
+        self._reported = len(self.errors)
+        return new_errors
+
+    def _end_string(self, end: int) -> None:
+        role = self._string_role
+        super()._end_string(end)
+        if role == _KEY_STRING and self._depth == 1 and not self.malformed:
+            self._schema.check_key(self._key, "arguments", self.errors)
+
+    def _end_value(self, end: int) -> None:
+        key, start = self._key, self._value_start
+        super()._end_value(end)
+        text = "".join(self._chunks)
+        raw = text[start - self._chunks_start:end - self._chunks_start]
+        self._chunks = [text[end - self._chunks_start:]]
+        self._chunks_start = end
+        self._keys.add(key)
+        try:
+            value = _json_loads(raw)
+        except ValueError:
+            self.errors.append(f"arguments.{key}: not valid JSON")
+            return
+        self._schema.check_member(key, value, "arguments", self.errors)
+
+    def _close(self) -> None:
+        super()._close()
+        self._chunks = []
+        self._schema.check_missing(self._keys, "arguments", self.errors)
+
+
+def _compile_tool_schemas(tools: Union[list, None]) -> dict[str, _ObjectSchema]:
+    schemas = {}
+    for tool in tools or ():
+        function = getattr(tool, "function", None)
+        name = getattr(function, "name", None)
+        if name:
+            schemas[name] = _ObjectSchema(getattr(function, "parameters", None) or {})
+    return schemas
+
+
+class BielikStreamState:
+    """Everything the parser remembers about one streamed response.
+
+    The parser itself only holds what is derived from the tokenizer, so one
+    parser can serve any number of concurrent streams, each with its own
+    state from `BielikToolParser.new_stream_state()`.
+    """
+
+    __slots__ = ("current_tool_id", "current_tool_name_sent", "prev_tool_call_arr", "streamed_arg_chunks",
+                 "tool_start_count", "tool_end_count", "token_cursor", "scanner", "pending_arguments",
+                 "tool_names", "tool_schemas", "arguments_checker")
+
+    def __init__(self):
+        self.current_tool_id: int = -1
         self.current_tool_name_sent: bool = False
         self.prev_tool_call_arr: list[dict] = []
-        self.current_tool_id: int = -1
-        self.streamed_args_for_tool: list[str] = [
-        ]  # map what has been streamed for each tool so far to a list
+        # what has been streamed for each tool so far, as a list of chunks
+        self.streamed_arg_chunks: list[list[str]] = []
+
+        # running totals, so every delta only has to look at
+        # delta_token_ids/delta_text instead of the whole output
+        self.tool_start_count: int = 0
+        self.tool_end_count: int = 0
+        self.token_cursor: int = 0  # len(previous_token_ids) we have counted
+        # lexer for the tool call being streamed, None while generating text
+        self.scanner: Union[_ToolCallScanner, None] = None
+        self.pending_arguments: str = ""  # arguments seen before the tool name
+        # prefixes of the request's tool names, built at the first tool call
+        self.tool_names: Union[dict[str, Union[str, None]], None] = None
+        # compiled parameters schemas when arguments are validated, and the
+        # checker of the tool call being streamed
+        self.tool_schemas: Union[dict[str, _ObjectSchema], None] = None
+        self.arguments_checker: Union[_ArgumentsChecker, None] = None
+
+    @property
+    def streamed_args_for_tool(self) -> list[str]:
+        return ["".join(chunks) for chunks in self.streamed_arg_chunks]
+
+
+# upper bounds of the stage latency histograms, in seconds
+_STAGE_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 5e-3, 2.5e-2)
+
+
+class _Histogram:
+    __slots__ = ("bounds_ns", "counts", "sum_ns")
+
+    def __init__(self, bounds_ns: tuple[int, ...]):
+        self.bounds_ns = bounds_ns
+        self.counts: list[int] = [0] * (len(bounds_ns) + 1)  # the last one is +Inf
+        self.sum_ns: int = 0
+
+    def observe(self, elapsed_ns: int) -> None:
+        self.counts[bisect.bisect_left(self.bounds_ns, elapsed_ns)] += 1
+        self.sum_ns += elapsed_ns
+
+
+class BielikParserMetrics:
+    """Call counts and latency histograms of the stages of the parser.
+
+    The stages of extract_tool_calls_streaming (method "stream") are
+    "count" (tag counting), "split" (cutting the delta at tags), "scan"
+    (incremental tool call JSON scanning, argument checks), "build"
+    (DeltaToolCall/DeltaMessage construction) and "total"; those of
+    extract_tool_calls ("extract") are "split", "parse", "build" and
+    "total". The counters are "tool_calls" and "errors" per method.
+
+    Parsers are instrumented when they are constructed, one timing per stage
+    call. Nothing is locked: vLLM runs every parser on its event loop thread.
+    """
+
+    def __init__(self, buckets: Sequence[float] = _STAGE_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._bounds_ns = tuple(round(bound * 1e9) for bound in self.buckets)
+        self.histograms: dict[tuple[str, str], _Histogram] = {}
+        self.counters: dict[tuple[str, str], int] = {}
+
+    def histogram(self, method: str, stage: str) -> _Histogram:
+        histogram = self.histograms.get((method, stage))
+        if histogram is None:
+            histogram = self.histograms[method, stage] = _Histogram(self._bounds_ns)
+        return histogram
+
+    def timed(self, method: str, stage: str, function: Callable) -> Callable:
+        """Wrap `function` so that every call is recorded as `stage` of `method`."""
+        observe = self.histogram(method, stage).observe
+        clock = time.perf_counter_ns
+
+        def timed_function(*args, **kwargs):
+            started = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                observe(clock() - started)
+        return timed_function
+
+    def count(self, method: str, name: str, value: int = 1) -> None:
+        self.counters[method, name] = self.counters.get((method, name), 0) + value
+
+    def reset(self) -> None:
+        # in place, the wrappers of constructed parsers keep their histograms
+        for histogram in self.histograms.values():
+            histogram.counts = [0] * len(histogram.counts)
+            histogram.sum_ns = 0
+        self.counters.clear()
+
+    def snapshot(self) -> dict:
+        """The metrics as plain data: per "method.stage" the call count, total and per-bucket counts."""
+        return {
+            "stages": {
+                f"{method}.{stage}": {
+                    "count": sum(histogram.counts),
+                    "sum_seconds": histogram.sum_ns / 1e9,
+                    "buckets": dict(zip([*self.buckets, float("inf")], histogram.counts)),
+                }
+                for (method, stage), histogram in self.histograms.items()
+            },
+            "counters": {f"{method}.{name}": value for (method, name), value in self.counters.items()},
+        }
+
+    def render_prometheus(self, prefix: str = "bielik_tool_parser") -> str:
+        """The metrics in the Prometheus text exposition format."""
+        lines = [f"# HELP {prefix}_stage_seconds Time spent in each stage of the tool parser.",
+                 f"# TYPE {prefix}_stage_seconds histogram"]
+        for (method, stage), histogram in sorted(self.histograms.items()):
+            labels = f'method="{method}",stage="{stage}"'
+            cumulative = 0
+            for bound, count in zip([*(f"{bound:g}" for bound in self.buckets), "+Inf"], histogram.counts):
+                cumulative += count
+                lines.append(f'{prefix}_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{prefix}_stage_seconds_sum{{{labels}}} {histogram.sum_ns / 1e9:.9f}")
+            lines.append(f"{prefix}_stage_seconds_count{{{labels}}} {cumulative}")
+        for name in sorted({name for _, name in self.counters}):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            for (method, counter), value in sorted(self.counters.items()):
+                if counter == name:
+                    lines.append(f'{prefix}_{name}_total{{method="{method}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+@ToolParserManager.register_module("bielik")
+class BielikToolParser(ToolParser):
+
+    # when set, every streamed delta is logged as one compact JSON record on
+    # the "<module>.trace" logger; when not set the streaming path does no
+    # logging at all. BIELIK_TOOL_PARSER_TRACE=1 turns it on for all parsers.
+    trace: bool = os.environ.get("BIELIK_TOOL_PARSER_TRACE", "0").lower() in ("1", "true", "yes")
+    # when set, a tool name is sent as soon as the part of it the model has
+    # written can only be one of the request's tools. A model inventing a name
+    # with the same start is then only logged: the client gets the tool name
+    # while extract_tool_calls returns what the model wrote, so it is off by
+    # default. BIELIK_TOOL_PARSER_EARLY_NAMES=1 turns it on.
+    early_tool_names: bool = os.environ.get("BIELIK_TOOL_PARSER_EARLY_NAMES", "0").lower() in ("1", "true", "yes")
+    # when set, streamed arguments are checked against the parameters schema
+    # of their tool; violations are logged and sent with the tool call delta
+    # as "argument_errors". BIELIK_TOOL_PARSER_VALIDATE=1 turns it on.
+    validate_arguments: bool = os.environ.get("BIELIK_TOOL_PARSER_VALIDATE", "0").lower() in ("1", "true", "yes")
+    # when set, parsers constructed from then on time their stages into it;
+    # when not set the stages run unwrapped. BIELIK_TOOL_PARSER_METRICS=1
+    # collects them for all parsers, see render_prometheus() and snapshot().
+    metrics: Union[BielikParserMetrics, None] = (
+        BielikParserMetrics() if os.environ.get("BIELIK_TOOL_PARSER_METRICS", "0").lower() in ("1", "true", "yes")
+        else None)
+
+    def __init__(self, tokenizer: AnyTokenizer):
+        # the state vLLM drives through extract_tool_calls_streaming without
+        # passing one; the ToolParser attributes below are views of it
+        self._state = BielikStreamState()
+        super().__init__(tokenizer)
 
         self.tool_call_start_token: str = "<tool_call>"
         self.tool_call_end_token: str = "</tool_call>"
 
-        self.tool_call_regex = re.compile(r"<tool_call>(.*?)</tool_call>|<tool_call>(.*)", re.DOTALL)
-
+        is_mistral = isinstance(self.model_tokenizer, MistralTokenizer)
+        if is_mistral:
+            self.model_tokenizer = self.model_tokenizer.tokenizer
         if not self.model_tokenizer:
             raise ValueError("The model tokenizer must be passed to the ToolParser constructor during construction.")
-        self.tool_call_start_token_id = self.vocab.get(self.tool_call_start_token)
-        self.tool_call_end_token_id = self.vocab.get(self.tool_call_end_token)
-        if self.tool_call_start_token_id is None or self.tool_call_end_token_id is None:
+
+        try:
+            token_ids = _tokenizer_constants.get(self.model_tokenizer)
+        except TypeError:  # the tokenizer does not support weak references
+            token_ids = None
+        if token_ids is None:
+            if is_mistral:
+                logger.warning("Detected Mistral tokenizer when using a Bielik model")
+            token_ids = self._tag_token_ids()
+            try:
+                _tokenizer_constants[self.model_tokenizer] = token_ids
+            except TypeError:
+                pass
+        self.tool_call_start_token_id, self.tool_call_end_token_id = token_ids
+        if self.metrics is not None:
+            self._instrument(self.metrics)
+
+    def _instrument(self, metrics: BielikParserMetrics) -> None:
+        """Shadow the stage methods with timed wrappers, on this parser only."""
+        for method, stage, name in (("stream", "total", "_extract_tool_calls_streaming"),
+                                    ("stream", "count", "_advance_stream_state"),
+                                    ("stream", "split", "_split_delta"),
+                                    ("stream", "scan", "_stream_tool_call"),
+                                    ("stream", "build", "_build_delta"),
+                                    ("extract", "total", "extract_tool_calls"),
+                                    ("extract", "split", "_split_tool_calls"),
+                                    ("extract", "parse", "_parse_tool_call"),
+                                    ("extract", "build", "_build_tool_call")):
+            setattr(self, name, metrics.timed(method, stage, getattr(self, name)))
+
+    def _tag_token_ids(self) -> tuple[int, int]:
+        start_token_id = self.vocab.get(self.tool_call_start_token)
+        end_token_id = self.vocab.get(self.tool_call_end_token)
+        if start_token_id is None or end_token_id is None:
             raise RuntimeError("Bielik Tool parser could not locate tool call start/end tokens in the tokenizer!")
-      
+        return start_token_id, end_token_id
+
+    def new_stream_state(self) -> BielikStreamState:
+        """Fresh state for one more stream, to pass to extract_tool_calls_streaming(state=...)."""
+        return BielikStreamState()
+
+    @property
+    def current_tool_id(self) -> int:
+        return self._state.current_tool_id
+
+    @current_tool_id.setter
+    def current_tool_id(self, value: int) -> None:
+        self._state.current_tool_id = value
+
+    @property
+    def current_tool_name_sent(self) -> bool:
+        return self._state.current_tool_name_sent
+
+    @current_tool_name_sent.setter
+    def current_tool_name_sent(self, value: bool) -> None:
+        self._state.current_tool_name_sent = value
+
+    @property
+    def prev_tool_call_arr(self) -> list[dict]:
+        # vLLM reads this when the request finishes, see streamed_args_for_tool.
+        # For a tool call that was cut off, the arguments streamed so far are
+        # completed into the value its check expects
+        state = self._state
+        tool_calls = state.prev_tool_call_arr
+        if state.scanner is None or not tool_calls or "arguments" in tool_calls[-1] \
+                or not state.streamed_arg_chunks[-1]:
+            return tool_calls
+        arguments = _complete_json_prefix(_dumps_prefix("".join(state.streamed_arg_chunks[-1])))
+        if arguments is None:
+            return tool_calls
+        return [*tool_calls[:-1], {**tool_calls[-1], "arguments": arguments}]
+
+    @prev_tool_call_arr.setter
+    def prev_tool_call_arr(self, value: list[dict]) -> None:
+        self._state.prev_tool_call_arr = value
+
+    @property
+    def streamed_args_for_tool(self) -> list[str]:
+        # vLLM reads this once, when the delta that finishes the request has
+        # arguments (max_tokens, or deltas of several tokens). It takes the
+        # arguments of that delta off the end, drops the rest from
+        # json.dumps(prev_tool_call_arr[i]["arguments"]) and sends what is
+        # left in place of that delta. The arguments were streamed as the
+        # model wrote them, so the part before the last delta is given in
+        # json.dumps form for that to work; the client then gets the rest of
+        # the arguments in that form. BielikStreamState.streamed_args_for_tool
+        # is the text as streamed.
+        return [_dumps_prefix("".join(chunks[:-1])) + chunks[-1] if len(chunks) > 1 else "".join(chunks)
+                for chunks in self._state.streamed_arg_chunks]
+
+    @streamed_args_for_tool.setter
+    def streamed_args_for_tool(self, value: list[str]) -> None:
+        self._state.streamed_arg_chunks = [[arguments] for arguments in value]
+
     def adjust_request(self, request: ChatCompletionRequest) -> ChatCompletionRequest:
         if request.tools and request.tool_choice != 'none':
             # do not skip special tokens because Bielik uses the special tokens
@@ -53,6 +874,220 @@ class BielikToolParser(ToolParser):
             request.skip_special_tokens = False
         return request
 
+    def _advance_stream_state(self, state: BielikStreamState, previous_token_ids: Sequence[int],
+                              delta_token_ids: Sequence[int]) -> list[tuple[int, int]]:
+        """Update the running tag counters with the tokens of this delta.
+
+        Returns the (position, token id) of every tool call tag in
+        delta_token_ids. When the caller's history does not line up with what
+        we have seen (first call, or vLLM restarting the token stream after
+        reasoning), the counters are rebuilt from scratch once.
+        """
+        start_id, end_id = self.tool_call_start_token_id, self.tool_call_end_token_id
+        if len(previous_token_ids) != state.token_cursor:
+            state.tool_start_count = previous_token_ids.count(start_id)
+            state.tool_end_count = previous_token_ids.count(end_id)
+            if state.tool_start_count <= state.tool_end_count:
+                state.scanner = None
+
+        tags = [(position, token_id) for position, token_id in enumerate(delta_token_ids)
+                if token_id == start_id or token_id == end_id]
+        for _, token_id in tags:
+            if token_id == start_id:
+                state.tool_start_count += 1
+            else:
+                state.tool_end_count += 1
+        state.token_cursor = len(previous_token_ids) + len(delta_token_ids)
+        return tags
+
+    def _split_delta(self, delta_text: str, delta_token_ids: Sequence[int],
+                     tags: list[tuple[int, int]]) -> list[tuple[Union[int, None], str]]:
+        """Split delta text at the tool call tag tokens.
+
+        Returns (tag token id, "") items for the tags and (None, text) items
+        for the text between them. Tag token positions are mapped to character
+        offsets once per delta; tag text written by the model as ordinary
+        tokens (e.g. inside an argument string) is never treated as a boundary.
+        """
+        if len(delta_token_ids) == 1:
+            return [(tags[0][1], "")]
+
+        tag_texts = [self.tool_call_start_token if token_id == self.tool_call_start_token_id
+                     else self.tool_call_end_token for _, token_id in tags]
+        offsets = []
+        if delta_text.count(self.tool_call_start_token) + delta_text.count(self.tool_call_end_token) == len(tags):
+            # every tag text in the delta is one of the tag tokens
+            pos = 0
+            for tag_text in tag_texts:
+                pos = delta_text.find(tag_text, pos)
+                if pos == -1:
+                    break
+                offsets.append((pos, len(tag_text)))
+                pos += len(tag_text)
+        if len(offsets) != len(tags):
+            offsets = self._locate_tags(delta_text, delta_token_ids, tags, tag_texts)
+
+        segments: list[tuple[Union[int, None], str]] = []
+        pos = 0
+        for (_, token_id), (offset, width) in zip(tags, offsets):
+            segments.append((None, delta_text[pos:offset]))
+            segments.append((token_id, ""))
+            pos = offset + width
+        segments.append((None, delta_text[pos:]))
+        return segments
+
+    def _locate_tags(self, delta_text: str, delta_token_ids: Sequence[int],
+                     tags: list[tuple[int, int]], tag_texts: list[str]) -> list[tuple[int, int]]:
+        """Find the (offset, width) of each tag token in delta text by decoding the tokens before it.
+
+        Only needed when the delta also holds tag text that is not a tag token,
+        or when the tags were left out of the text.
+        """
+        offsets = []
+        pos = 0
+        for (position, _), tag_text in zip(tags, tag_texts):
+            hint = max(pos, len(self.model_tokenizer.decode(delta_token_ids[:position])))
+            best = -1
+            loc = delta_text.find(tag_text, pos)
+            while loc != -1:
+                if best == -1 or abs(loc - hint) < abs(best - hint):
+                    best = loc
+                loc = delta_text.find(tag_text, loc + 1)
+            if best == -1:
+                offsets.append((min(hint, len(delta_text)), 0))
+                pos = min(hint, len(delta_text))
+            else:
+                offsets.append((best, len(tag_text)))
+                pos = best + len(tag_text)
+        return offsets
+
+    def _start_tool_call(self, state: BielikStreamState, request: ChatCompletionRequest) -> None:
+        if state.tool_names is None:
+            state.tool_names = _tool_name_prefixes(getattr(request, "tools", None)) if self.early_tool_names else {}
+            if self.validate_arguments:
+                state.tool_schemas = _compile_tool_schemas(getattr(request, "tools", None))
+        if self.metrics is not None:
+            self.metrics.count("stream", "tool_calls")
+        state.current_tool_id += 1
+        state.current_tool_name_sent = False
+        state.prev_tool_call_arr.append({})
+        state.streamed_arg_chunks.append([])
+        state.scanner = _ToolCallScanner()
+        state.pending_arguments = ""
+        state.arguments_checker = None
+
+    @staticmethod
+    def _stream_tool_call(state: BielikStreamState, text: str, tool_deltas: dict[int, dict]) -> None:
+        """Feed tool call text to the scanner and collect what can be sent for it."""
+        scanner = state.scanner
+        tool_id = state.current_tool_id
+        arguments = scanner.feed(text)
+
+        # case - we haven't sent the tool name yet. If it's available, send it. otherwise, wait until it's available.
+        if not state.current_tool_name_sent:
+            name = scanner.name
+            if name is None:
+                # send the name once what has been written of it can only
+                # become one of the request's tools
+                prefix = scanner.name_prefix()
+                if prefix:
+                    name = state.tool_names.get(prefix)
+            if name is None:
+                state.pending_arguments += arguments
+                return
+            state.current_tool_name_sent = True
+            state.prev_tool_call_arr[tool_id]["name"] = name
+            tool_deltas[tool_id] = {
+                "id": f"chatcmpl-tool-{random_uuid()}",
+                "type": "function",
+                "name": name,
+            }
+            arguments = state.pending_arguments + arguments
+            state.pending_arguments = ""
+            if state.tool_schemas is not None:
+                schema = state.tool_schemas.get(name)
+                if schema is None:
+                    tool_deltas[tool_id]["argument_errors"] = [f"{name!r} is not one of the request's tools"]
+                    logger.warning("tool call %s: %r is not one of the request's tools", tool_id, name)
+                else:
+                    state.arguments_checker = _ArgumentsChecker(schema)
+        elif scanner.name is not None and state.prev_tool_call_arr[tool_id]["name"] != scanner.name:
+            # the model went on to write a name that is not one of the tools
+            logger.warning("tool call %s was sent as %r but the model wrote %r",
+                           tool_id, state.prev_tool_call_arr[tool_id]["name"], scanner.name)
+            state.prev_tool_call_arr[tool_id]["name"] = scanner.name
+
+        # case -- otherwise, forward the raw argument text as it arrives
+        if arguments:
+            entry = tool_deltas.setdefault(tool_id, {})
+            entry["arguments"] = entry.get("arguments", "") + arguments
+            state.streamed_arg_chunks[tool_id].append(arguments)
+            if state.arguments_checker is not None:
+                errors = state.arguments_checker.check(arguments)
+                if errors:
+                    entry.setdefault("argument_errors", []).extend(errors)
+                    for error in errors:
+                        logger.warning("tool call %s (%s): %s", tool_id, state.prev_tool_call_arr[tool_id]["name"],
+                                       error)
+
+        # keep the parsed arguments around once complete, vLLM's serving layer
+        # compares them with what was streamed when the request finishes
+        prev_tool_call = state.prev_tool_call_arr[tool_id]
+        if scanner.arguments_end >= 0 and "arguments" not in prev_tool_call:
+            try:
+                prev_tool_call["arguments"] = _json_loads("".join(state.streamed_arg_chunks[tool_id]))
+            except ValueError:
+                logger.debug("unable to parse JSON")
+
+    def _split_tool_calls(self, model_output: str, start: int) -> list[str]:
+        """Return the text of every tool call, from the tag at `start` on.
+
+        A tool call runs from <tool_call> to the next </tool_call>, or to the
+        end of the output when it was cut off.
+        """
+        tool_call_texts = []
+        while start != -1:
+            start += len(self.tool_call_start_token)
+            end = model_output.find(self.tool_call_end_token, start)
+            if end == -1:
+                tool_call_texts.append(model_output[start:])
+                break
+            tool_call_texts.append(model_output[start:end])
+            start = model_output.find(self.tool_call_start_token, end + len(self.tool_call_end_token))
+        return tool_call_texts
+
+    @staticmethod
+    def _build_tool_call(name: str, arguments: str) -> ToolCall:
+        return ToolCall(type="function", function=FunctionCall(name=name, arguments=arguments))
+
+    @staticmethod
+    def _parse_tool_call(tool_call_text: str) -> tuple[str, str]:
+        """Decode one tool call object into its name and the raw text of its arguments."""
+        match = _TOOL_CALL_PREFIX.match(tool_call_text)
+        if match:
+            # fast path: the arguments run up to the closing brace of the
+            # object, so they only need decoding once to check them
+            name = match.group(1)
+            if "\\" in name:
+                name = json.loads(f'"{name}"')
+            body = tool_call_text.rstrip()
+            if body.endswith("}"):
+                arguments = body[match.end():-1].rstrip()
+                try:
+                    _json_loads(arguments)
+                    return name, arguments
+                except ValueError:
+                    pass
+
+        # any other key order or layout: decode the object once and let the
+        # scanner find where its arguments are
+        function_call = _json_loads(tool_call_text)
+        if not isinstance(function_call, dict) or "name" not in function_call or "arguments" not in function_call:
+            raise KeyError("A tool call needs both a name and arguments")
+        scanner = _ToolCallScanner()
+        scanner.feed(tool_call_text)
+        return function_call["name"], tool_call_text[scanner.arguments_start:scanner.arguments_end]
+
     def extract_tool_calls(
         self,
         model_output: str,
@@ -60,41 +1095,31 @@ class BielikToolParser(ToolParser):
     ) -> ExtractedToolCallInformation:
 
         # sanity check; avoid unnecessary processing
-        if self.tool_call_start_token not in model_output:
+        start = model_output.find(self.tool_call_start_token)
+        if start == -1:
             return ExtractedToolCallInformation(tools_called=False,
                                                 tool_calls=[],
                                                 content=model_output)
         else:
             try:
-                # there are two possible captures - between tags, or between a
-                # tag and end-of-string so the result of
-                # findall is an array of tuples where one is a function call and
-                # the other is None
-                function_call_tuples = self.tool_call_regex.findall(model_output)
-
-                # load the JSON, and then use it to build the Function and Tool Call
-                raw_function_calls = [
-                    json.loads(match[0] if match[0] else match[1])
-                    for match in function_call_tuples
-                ]
-                tool_calls = [
-                    ToolCall(
-                        type="function",
-                        function=FunctionCall(
-                            name=function_call["name"],
-                            # function call args are JSON but as a string
-                            arguments=json.dumps(function_call["arguments"],
-                                                 ensure_ascii=False)))
-                    for function_call in raw_function_calls
-                ]
-
-                content = model_output[:model_output.find(self.tool_call_start_token)]
+                # decode each tool call once, and keep its arguments as the
+                # model wrote them - they are JSON already, so they are
+                # passed on as a string without re-serialising
+                tool_calls = []
+                for tool_call_text in self._split_tool_calls(model_output, start):
+                    tool_calls.append(self._build_tool_call(*self._parse_tool_call(tool_call_text)))
+                if self.metrics is not None:
+                    self.metrics.count("extract", "tool_calls", len(tool_calls))
+
+                content = model_output[:start]
                 return ExtractedToolCallInformation(
                     tools_called=True,
                     tool_calls=tool_calls,
                     content=content if content else None)
             except Exception:
                 logger.exception("Error in extracting tool call from response.")
+                if self.metrics is not None:
+                    self.metrics.count("extract", "errors")
                 return ExtractedToolCallInformation(tools_called=False,
                                                     tool_calls=[],
                                                     content=model_output)
@@ -108,210 +1133,124 @@ class BielikToolParser(ToolParser):
         current_token_ids: Sequence[int],
         delta_token_ids: Sequence[int],
         request: ChatCompletionRequest,
+        state: Union[BielikStreamState, None] = None,
     ) -> Union[DeltaMessage, None]:
+        """Turn one delta of the model output into content and tool call deltas.
+
+        Without `state` the parser's own state is used, which is what vLLM
+        expects; pass a state from new_stream_state() to serve several streams
+        with one parser.
+        """
+        if state is None:
+            state = self._state
+        if not self.trace:
+            return self._extract_tool_calls_streaming(state, delta_text, previous_token_ids, delta_token_ids, request)
+
+        tag_count = state.tool_start_count + state.tool_end_count
+        started = time.perf_counter_ns()
+        delta = self._extract_tool_calls_streaming(state, delta_text, previous_token_ids, delta_token_ids, request)
+        elapsed = time.perf_counter_ns() - started
+        self._trace_delta(state, request, delta_token_ids, state.tool_start_count + state.tool_end_count - tag_count,
+                          delta, elapsed)
+        return delta
+
+    @staticmethod
+    def _trace_delta(state: BielikStreamState, request: ChatCompletionRequest, delta_token_ids: Sequence[int],
+                     tag_count: int, delta: Union[DeltaMessage, None], elapsed_ns: int) -> None:
+        """Log what one streamed delta did as a single JSON record."""
+        record = {
+            "request": getattr(request, "request_id", None),
+            "tokens": len(delta_token_ids),
+            "tags": tag_count,
+            "tool": state.current_tool_id,
+            "in_tool": state.scanner is not None,
+            "ns": elapsed_ns,
+        }
+        if delta is not None:
+            if delta.content:
+                record["content"] = len(delta.content)
+            for tool_call in delta.tool_calls or ():
+                if tool_call.function is None:
+                    continue
+                if tool_call.function.name:
+                    record["name"] = tool_call.function.name
+                if tool_call.function.arguments:
+                    record["arguments"] = record.get("arguments", 0) + len(tool_call.function.arguments)
+        else:
+            record["skipped"] = True
+        trace_logger.info("%s", json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+
+    def _extract_tool_calls_streaming(
+        self,
+        state: BielikStreamState,
+        delta_text: str,
+        previous_token_ids: Sequence[int],
+        delta_token_ids: Sequence[int],
+        request: ChatCompletionRequest,
+    ) -> Union[DeltaMessage, None]:
+        # figure out where we are in the parsing from the running tool call start & end tag counts
+        tags = self._advance_stream_state(state, previous_token_ids, delta_token_ids)
 
-        logger.debug("delta_text: %s", delta_text)
-        logger.debug("delta_token_ids: %s", delta_token_ids)
         # check to see if we should be streaming a tool call - is there a
-        if self.tool_call_start_token_id not in current_token_ids:
-            logger.debug("No tool call tokens found!")
+        if state.tool_start_count == 0:
             return DeltaMessage(content=delta_text)
 
         try:
-            # figure out where we are in the parsing by counting tool call start & end tags
-            prev_tool_start_count = previous_token_ids.count(self.tool_call_start_token_id)
-            prev_tool_end_count = previous_token_ids.count(self.tool_call_end_token_id)
-            cur_tool_start_count = current_token_ids.count(self.tool_call_start_token_id)
-            cur_tool_end_count = current_token_ids.count(self.tool_call_end_token_id)
-            tool_call_portion = None
-            text_portion = None
-
-            # case: if we're generating text, OR rounding out a tool call
-            if (cur_tool_start_count == cur_tool_end_count
-                    and prev_tool_end_count == cur_tool_end_count
-                    and self.tool_call_end_token not in delta_text):
-                logger.debug("Generating text content! skipping tool parsing.")
-                return DeltaMessage(content=delta_text)
-
-            if self.tool_call_end_token in delta_text:
-                logger.debug("tool_call_end_token in delta_text")
-                full_text = current_text + delta_text
-                tool_call_portion = full_text.split(
-                    self.tool_call_start_token)[-1].split(
-                        self.tool_call_end_token)[0].rstrip()
-                delta_text = delta_text.split(
-                    self.tool_call_end_token)[0].rstrip()
-                text_portion = delta_text.split(
-                    self.tool_call_end_token)[-1].lstrip()
-
-            # case: if tool open & close tag counts don't match, we're doing
-            # imaginary "else" block here
-            # something with tools with this diff.
-            # flags for partial JSON parting. exported constants from
-            # "Allow" are handled via BIT MASK
-            flags = Allow.ALL if self.current_tool_name_sent else Allow.ALL & ~Allow.STR
-
-            # case -- we're starting a new tool call
-            if cur_tool_start_count > cur_tool_end_count and cur_tool_start_count > prev_tool_start_count:
-                if len(delta_token_ids) > 1:
-                    tool_call_portion = current_text.split(self.tool_call_start_token)[-1]
-                else:
-                    tool_call_portion = None
-                    delta = None
-
-                text_portion = None
-
-                # set cursors and state appropriately
-                self.current_tool_id += 1
-                self.current_tool_name_sent = False
-                self.streamed_args_for_tool.append("")
-                logger.debug("Starting on a new tool %s", self.current_tool_id)
-
-            # case -- we're updating an existing tool call
-            elif cur_tool_start_count > cur_tool_end_count and cur_tool_start_count == prev_tool_start_count:
-                # get the portion of the text that's the tool call
-                tool_call_portion = current_text.split(self.tool_call_start_token)[-1]
-                text_portion = None
-
-            # case -- the current tool call is being closed.
-            elif cur_tool_start_count == cur_tool_end_count and cur_tool_end_count >= prev_tool_end_count:
-                if self.prev_tool_call_arr is None or len(self.prev_tool_call_arr) == 0:
-                    logger.debug("attempting to close tool call, but no tool call")
-                    return None
-                diff = self.prev_tool_call_arr[self.current_tool_id].get("arguments")
-                if diff:
-                    diff = diff.encode('utf-8').decode('unicode_escape') if isinstance(diff, str) else diff
-                    if '"}' not in delta_text:
-                        return None
-                    end_loc = delta_text.rindex('"}')
-                    diff = delta_text[:end_loc] + '"}'
-                    logger.debug("Finishing tool and found diff that had not been streamed yet: %s", diff)
-                    self.streamed_args_for_tool[self.current_tool_id] += diff
-                    return DeltaMessage(tool_calls=[
-                        DeltaToolCall(index=self.current_tool_id,
-                                      function=DeltaFunctionCall(
-                                          arguments=diff).model_dump(
-                                              exclude_none=True))
-                    ])
-
-            # case -- otherwise we're just generating text
+            if not tags:
+                # case: if we're generating text, skip tool parsing altogether
+                if state.scanner is None:
+                    return DeltaMessage(content=delta_text)
+                segments = [(None, delta_text)]
             else:
-                text = delta_text.replace(self.tool_call_start_token, "")
-                text = text.replace(self.tool_call_end_token, "")
-                delta = DeltaMessage(tool_calls=[], content=text)
-                return delta
+                segments = self._split_delta(delta_text, delta_token_ids, tags)
 
-            try:
-                current_tool_call = partial_json_parser.loads(
-                    tool_call_portion or "{}",
-                    flags) if tool_call_portion else None
-                logger.debug("Parsed tool call %s", current_tool_call)
-            except partial_json_parser.core.exceptions.MalformedJSON:
-                logger.debug('not enough tokens to parse into JSON yet')
-                return None
-            except json.decoder.JSONDecodeError:
-                logger.debug("unable to parse JSON")
-                return None
+            content = []
+            tool_deltas: dict[int, dict] = {}
+            for tag, segment in segments:
+                if tag == self.tool_call_start_token_id:
+                    # case -- we're starting a new tool call
+                    self._start_tool_call(state, request)
+                elif tag is not None:
+                    # case -- the current tool call is being closed
+                    if state.scanner is not None and not state.current_tool_name_sent:
+                        logger.debug("closing tool call %s before its name was found", state.current_tool_id)
+                    state.scanner = None
+                elif state.scanner is not None:
+                    # case -- we're updating an existing tool call
+                    self._stream_tool_call(state, segment, tool_deltas)
+                elif segment:
+                    # case -- otherwise we're just generating text
+                    content.append(segment)
 
-            # case - we haven't sent the tool name yet. If it's available, send it. otherwise, wait until it's available.
-            if not self.current_tool_name_sent:
-                if current_tool_call is None:
-                    return None
-                function_name: Union[str, None] = current_tool_call.get("name")
-                if function_name:
-                    self.current_tool_name_sent = True
-                    return DeltaMessage(tool_calls=[
-                        DeltaToolCall(index=self.current_tool_id,
-                                      type="function",
-                                      id=f"chatcmpl-tool-{random_uuid()}",
-                                      function=DeltaFunctionCall(
-                                          name=function_name).model_dump(
-                                              exclude_none=True))
-                    ])
-                else:
-                    return None
-            # case -- otherwise, send the tool call delta
-
-            # if the tool call portion is None, send the delta as text
-            if tool_call_portion is None:
-                # if there's text but not tool calls, send that -
-                # otherwise None to skip chunk
-                delta = DeltaMessage(content=delta_text) if text_portion is not None else None
-                return delta
-
-            # now, the nitty-gritty of tool calls
-            # now we have the portion to parse as tool call.
-
-            logger.debug("Trying to parse current tool call with ID %s", self.current_tool_id)
-
-            # if we're starting a new tool call, push an empty object in as a placeholder for the arguments
-            if len(self.prev_tool_call_arr) <= self.current_tool_id:
-                self.prev_tool_call_arr.append({})
-
-            # main logic for tool parsing here - compare prev. partially-parsed JSON to the current partially-parsed JSON
-            prev_arguments = self.prev_tool_call_arr[self.current_tool_id].get("arguments")
-            cur_arguments = current_tool_call.get("arguments")
-
-            logger.debug("diffing old arguments: %s", prev_arguments)
-            logger.debug("against new ones: %s", cur_arguments)
-
-            # case -- no arguments have been created yet. skip sending a delta.
-            if not cur_arguments and not prev_arguments:
-                logger.debug("Skipping text %s - no arguments", delta_text)
-                delta = None
-
-            # case -- prev arguments are defined, but non are now.
-            #   probably impossible, but not a fatal error - just keep going
-            elif not cur_arguments and prev_arguments:
-                logger.error("should be impossible to have arguments reset mid-call. skipping streaming anything.")
-                delta = None
-
-            # case -- we now have the first info about arguments available from autocompleting the JSON
-            elif cur_arguments and not prev_arguments:
-                cur_arguments_json = json.dumps(cur_arguments, ensure_ascii=False)
-                logger.debug("finding %s in %s", delta_text, cur_arguments_json)
-
-                # get the location where previous args differ from current
-                if delta_text not in cur_arguments_json[:-2]:
-                    return None
-                args_delta_start_loc = cur_arguments_json[:-2].rindex(delta_text) + len(delta_text)
-
-                # use that to find the actual delta
-                arguments_delta = cur_arguments_json[:args_delta_start_loc]
-                logger.debug("First tokens in arguments received: %s", arguments_delta)
-
-                delta = DeltaMessage(tool_calls=[
-                    DeltaToolCall(index=self.current_tool_id,
-                                  function=DeltaFunctionCall(
-                                      arguments=arguments_delta).model_dump(
-                                          exclude_none=True))
-                ])
-                self.streamed_args_for_tool[self.current_tool_id] += arguments_delta
-
-            # last case -- we have an update to existing arguments.
-            elif cur_arguments and prev_arguments:
-                if isinstance(delta_text, str) and len(delta_text.rstrip(
-                )) >= 1 and delta_text.rstrip()[-1] == '}':
-                    delta_text = delta_text.rstrip()[:-1]
-
-                logger.debug("got diff %s", delta_text)
-
-                delta = DeltaMessage(tool_calls=[
-                    DeltaToolCall(index=self.current_tool_id,
-                                  function=DeltaFunctionCall(
-                                      arguments=delta_text).model_dump(
-                                          exclude_none=True))
-                ])
-                self.streamed_args_for_tool[self.current_tool_id] += delta_text
-
-            # handle saving the state for the current tool into
-            # the "prev" list for use in diffing for the next iteration
-            if self.current_tool_id == len(self.prev_tool_call_arr) - 1:
-                self.prev_tool_call_arr[self.current_tool_id] = current_tool_call
-            else:
-                self.prev_tool_call_arr.append(current_tool_call)
-
-            return delta
+            if not content and not tool_deltas:
+                # nothing new to send for this delta, skip the chunk
+                return None
+            return self._build_delta(content, tool_deltas)
         except Exception:
             logger.exception("Error trying to handle streaming tool call.")
+            if self.metrics is not None:
+                self.metrics.count("stream", "errors")
             return None  # do not stream a delta. skip this token ID.
+
+    @staticmethod
+    def _build_delta(content: list[str], tool_deltas: dict[int, dict]) -> DeltaMessage:
+        if not tool_deltas:
+            return DeltaMessage(content="".join(content))
+        delta_tool_calls = []
+        for index, entry in tool_deltas.items():
+            delta_tool_call = DeltaToolCall(index=index,
+                                            type=entry.get("type"),
+                                            id=entry.get("id"),
+                                            function=DeltaFunctionCall(
+                                                name=entry.get("name"),
+                                                arguments=entry.get("arguments")).model_dump(
+                                                    exclude_none=True))
+            if "argument_errors" in entry:
+                # vLLM's protocol models allow extra fields, but validating one
+                # logs "present in the request but ignored" for every delta.
+                # Assigned after validation it is kept without a warning and
+                # serialised into the chunk (it also counts as set for
+                # exclude_unset)
+                delta_tool_call.argument_errors = entry["argument_errors"]
+            delta_tool_calls.append(delta_tool_call)
+        return DeltaMessage(content="".join(content) if content else None, tool_calls=delta_tool_calls)
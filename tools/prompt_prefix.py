@@ -0,0 +1,120 @@
+"""Keep the tool preamble of bielik_advanced_chat_template.jinja byte-identical between requests.
+
+The template writes the system prompt and every tool definition (with
+`tojson`, which keeps the key order it is given) at the start of the prompt,
+so vLLM's automatic prefix caching only reuses that preamble when requests
+list the same tools in the same order with the same keys. `canonical_tools`
+and `canonical_system_prompt` give one fixed layout for both:
+
+    from prompt_prefix import canonical_request
+    client.chat.completions.create(model=model, **canonical_request({"messages": messages, "tools": tools}))
+
+and the command line reports how many tokens two requests (JSON bodies of
+/v1/chat/completions) share, which needs `transformers` and `jinja2`:
+
+    python tools/prompt_prefix.py request_a.json request_b.json --canonical
+"""
+import argparse
+import json
+import os
+from typing import Any
+
+DEFAULT_TOKENIZER = "speakleash/Bielik-11B-v2.5-Instruct"
+DEFAULT_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bielik_advanced_chat_template.jinja")
+# vLLM caches the prompt in blocks of this many tokens, only full blocks are reused
+DEFAULT_BLOCK_SIZE = 16
+
+
+def _sorted_keys(value: Any) -> Any:
+    if isinstance(value, dict):
+        value = {key: _sorted_keys(value[key]) for key in sorted(value)}
+        if isinstance(value.get("required"), list) and all(isinstance(key, str) for key in value["required"]):
+            value["required"] = sorted(set(value["required"]))
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_sorted_keys(item) for item in value]
+    return value
+
+
+def canonical_tools(tools: list) -> list:
+    """Tool definitions sorted by name, with the keys of every object sorted.
+
+    Lists keep their order (enum values can carry meaning), except the
+    `required` lists of JSON schemas, which are sorted.
+    """
+    return sorted((_sorted_keys(tool) for tool in tools),
+                  key=lambda tool: (tool.get("function") or {}).get("name", ""))
+
+
+def canonical_system_prompt(text: str) -> str:
+    """The system prompt with `\\n` line ends, no trailing spaces and no leading or trailing blank lines."""
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def canonical_request(request: dict) -> dict:
+    """A copy of a chat completion request with its tools and system prompt in canonical form."""
+    request = dict(request)
+    if request.get("tools"):
+        request["tools"] = canonical_tools(request["tools"])
+    messages = list(request.get("messages") or ())
+    if messages and messages[0].get("role") == "system" and isinstance(messages[0].get("content"), str):
+        messages[0] = {**messages[0], "content": canonical_system_prompt(messages[0]["content"])}
+    request["messages"] = messages
+    return request
+
+
+def render_prompt(tokenizer, request: dict, chat_template: str) -> list[int]:
+    """Token ids of the prompt vLLM builds for `request` with `chat_template`."""
+    text = tokenizer.apply_chat_template(
+        request["messages"], tools=request.get("tools"), chat_template=chat_template, tokenize=False,
+        add_generation_prompt=request.get("add_generation_prompt", True),
+        **(request.get("chat_template_kwargs") or {}))
+    # the template writes bos_token itself
+    return tokenizer.encode(text, add_special_tokens=False)
+
+
+def shared_prefix(tokens_a: list[int], tokens_b: list[int]) -> int:
+    """Number of leading tokens the two prompts have in common."""
+    shared = 0
+    for a, b in zip(tokens_a, tokens_b):
+        if a != b:
+            break
+        shared += 1
+    return shared
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("requests", nargs=2, type=argparse.FileType(encoding="utf-8"),
+                        help="two chat completion request bodies (JSON)")
+    parser.add_argument("--tokenizer", default=DEFAULT_TOKENIZER)
+    parser.add_argument("--template", default=DEFAULT_TEMPLATE)
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE, help="vLLM KV cache block size")
+    parser.add_argument("--canonical", action="store_true",
+                        help="also compare the requests after canonical_request")
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    with open(args.template, encoding="utf-8") as template_file:
+        chat_template = template_file.read()
+    requests = [json.load(request_file) for request_file in args.requests]
+
+    variants = [("as sent", requests)]
+    if args.canonical:
+        variants.append(("canonical", [canonical_request(request) for request in requests]))
+    for label, (request_a, request_b) in variants:
+        tokens_a = render_prompt(tokenizer, request_a, chat_template)
+        tokens_b = render_prompt(tokenizer, request_b, chat_template)
+        shared = shared_prefix(tokens_a, tokens_b)
+        cached = shared // args.block_size * args.block_size
+        print(f"{label}: {len(tokens_a)} and {len(tokens_b)} tokens, {shared} shared, "
+              f"{cached} reusable from the prefix cache ({cached / max(len(tokens_b), 1):.0%} of the second prompt)")
+        if shared < min(len(tokens_a), len(tokens_b)):
+            print(f"  first difference at token {shared}: "
+                  f"{tokenizer.decode(tokens_a[shared:shared + 12])!r} vs {tokenizer.decode(tokens_b[shared:shared + 12])!r}")
+
+
+if __name__ == "__main__":
+    main()